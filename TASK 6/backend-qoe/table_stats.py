@@ -0,0 +1,162 @@
+"""
+Cheap table statistics and a side-effect-free connectivity probe for the debug endpoints.
+
+Row counts come from the planner's catalog estimates (pg_class.reltuples,
+falling back to pg_stat_user_tables.n_live_tup for never-analyzed tables),
+read for all tables in one query, so a debug request never scans a table.
+Exact COUNT(*) values are optional: they are computed by one background
+thread, with a statement timeout, and cached for EXACT_COUNT_TTL seconds.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+ESTIMATE_CACHE_TTL = float(os.getenv("TABLE_STATS_ESTIMATE_TTL", "30"))
+EXACT_COUNT_TTL = float(os.getenv("TABLE_STATS_EXACT_TTL", "600"))
+EXACT_COUNT_TIMEOUT_MS = int(os.getenv("TABLE_STATS_EXACT_TIMEOUT_MS", "30000"))
+
+# Tables whose write privileges the probe reports (instead of a test INSERT/DELETE)
+PROBE_TABLES = ["users", "feedback", "network_logs"]
+
+
+class TableStats:
+    """Row count estimates (cached briefly) and background exact counts"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._estimates: Optional[Dict[str, Any]] = None
+        self._estimated_at = 0.0
+        self._exact: Dict[str, Any] = {}
+        self._exact_at: Optional[float] = None
+        self._exact_error: Optional[str] = None
+        self._exact_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def estimates(self) -> Dict[str, Any]:
+        """{"method": ..., "counts": {table: approximate rows}}"""
+        now = time.monotonic()
+        if self._estimates is None or now - self._estimated_at > ESTIMATE_CACHE_TTL:
+            self._estimates = self._read_estimates()
+            self._estimated_at = now
+        return self._estimates
+
+    def _read_estimates(self) -> Dict[str, Any]:
+        with self.engine.connect() as conn:
+            if self.engine.dialect.name == "postgresql":
+                rows = conn.execute(text(
+                    "SELECT c.relname, c.reltuples::bigint, s.n_live_tup, "
+                    "GREATEST(s.last_analyze, s.last_autoanalyze) AS analyzed_at "
+                    "FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid "
+                    "WHERE c.relkind IN ('r', 'p') AND c.relnamespace = to_regnamespace(current_schema())"
+                )).all()
+                return {
+                    "method": "pg_class.reltuples",
+                    # reltuples is -1 (PostgreSQL 14+) or 0 before the first ANALYZE
+                    "counts": {name: (reltuples if reltuples > 0 else (live or 0)) for name, reltuples, live, _ in rows},
+                    "analyzed_at": {name: analyzed_at for name, _, _, analyzed_at in rows},
+                }
+            # SQLite keeps no row estimates; the largest rowid is a B-tree lookup
+            # and equals the row count when rows are never deleted
+            names = conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            )).scalars().all()
+            counts = {}
+            for name in names:
+                try:
+                    counts[name] = conn.execute(text(f'SELECT MAX(_ROWID_) FROM "{name}"')).scalar() or 0
+                except SQLAlchemyError:
+                    counts[name] = None  # WITHOUT ROWID table
+            return {"method": "sqlite max(rowid)", "counts": counts}
+
+    def exact(self, tables: List[str], refresh: bool = True) -> Dict[str, Any]:
+        """Cached exact counts; starts a background recount when stale.
+
+        Never blocks on COUNT(*): the first call returns status "pending" and
+        a later call picks up the result.
+        """
+        with self._lock:
+            running = self._exact_thread is not None and self._exact_thread.is_alive()
+            stale = self._exact_at is None or time.monotonic() - self._exact_at > EXACT_COUNT_TTL
+            if refresh and stale and not running:
+                self._exact_thread = threading.Thread(
+                    target=self._count_exact, args=(list(tables),), name="table-stats-exact", daemon=True
+                )
+                self._exact_thread.start()
+                running = True
+            return {
+                "counts": dict(self._exact),
+                "age_seconds": round(time.monotonic() - self._exact_at, 1) if self._exact_at is not None else None,
+                "status": "refreshing" if running and self._exact_at is not None
+                          else "pending" if running else "ready" if self._exact_at is not None else "not computed",
+                "error": self._exact_error,
+            }
+
+    def _count_exact(self, tables: List[str]):
+        counts, error = {}, None
+        try:
+            with self.engine.connect() as conn:
+                for table in tables:
+                    with conn.begin():
+                        if self.engine.dialect.name == "postgresql":
+                            # Bounded load: a huge table yields a timeout, not a long scan
+                            conn.execute(text(f"SET LOCAL statement_timeout = {EXACT_COUNT_TIMEOUT_MS}"))
+                        try:
+                            counts[table] = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+                        except SQLAlchemyError as e:
+                            counts[table] = f"Error: {str(e).splitlines()[0]}"
+        except Exception as e:
+            error = str(e)
+        with self._lock:
+            self._exact.update(counts)
+            self._exact_at = time.monotonic()
+            self._exact_error = error
+
+
+def probe_connection(engine) -> Dict[str, Any]:
+    """Read-only connectivity check: round trip, server identity and privileges.
+
+    Runs in a read-only transaction that is rolled back, so it can never
+    leave rows, sequence gaps or locks behind in production tables.
+    """
+    result: Dict[str, Any] = {"connected": False}
+    started = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("SET TRANSACTION READ ONLY"))
+                db_name, user, version = conn.execute(
+                    text("SELECT current_database(), current_user, version()")
+                ).one()
+                result["database_info"] = {
+                    "database": db_name,
+                    "user": user,
+                    "version": version[:100] + "..." if len(version) > 100 else version
+                }
+                # What the test INSERT/DELETE used to find out, without writing;
+                # has_table_privilege(NULL oid) is NULL, so missing tables don't error
+                privileges = {}
+                for name, exists, can_select, can_insert, can_delete in conn.execute(text(
+                    "SELECT name, to_regclass(name) IS NOT NULL, "
+                    "has_table_privilege(to_regclass(name), 'SELECT'), "
+                    "has_table_privilege(to_regclass(name), 'INSERT'), "
+                    "has_table_privilege(to_regclass(name), 'DELETE') "
+                    "FROM unnest(CAST(:names AS text[])) AS name"
+                ), {"names": PROBE_TABLES}):
+                    privileges[name] = (
+                        {"select": can_select, "insert": can_insert, "delete": can_delete} if exists else "missing"
+                    )
+                result["privileges"] = privileges
+                result["read_only_session"] = conn.execute(text("SHOW transaction_read_only")).scalar() == "on"
+            else:
+                version = conn.execute(text("SELECT sqlite_version()")).scalar()
+                result["database_info"] = {"database": "sqlite", "version": version}
+            conn.rollback()
+        result["connected"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
@@ -0,0 +1,282 @@
+"""
+Embedded columnar analytics replica (DuckDB) of network_logs and feedback.
+
+A background job copies new rows from the primary database into a local
+DuckDB file in micro-batches, picking rows up by id like the rollup job
+(one run behind the newest id, so inserts still in flight have committed).
+Scan-heavy admin aggregations then run vectorized on the local file
+instead of loading the OLTP database that serves phone ingest.
+
+The replica is append-only: rows later removed from the primary by
+archival or retention stay queryable here. Rows rehydrated into the
+primary keep their ids and are not copied twice.
+
+Enabled when duckdb is installed and ANALYTICS_DUCKDB_PATH is set. DuckDB
+files are opened by one process at a time, so with several API workers
+only one of them should set the path. Queries fall back to the primary
+while the replica has not synced for ANALYTICS_MAX_STALENESS_SECONDS.
+
+Run manually with:  python analytics_store.py
+"""
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Boolean, DateTime, Float, Integer, func, select
+
+from database import SessionLocal
+from models import Feedback, NetworkLog
+from parquet_export import PYARROW_AVAILABLE
+
+# duckdb is optional; analytics queries stay on the primary without it
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+    print("⚠️ duckdb library not available, analytics replica disabled")
+
+if PYARROW_AVAILABLE:
+    import pyarrow as pa
+
+ANALYTICS_DUCKDB_PATH = os.getenv("ANALYTICS_DUCKDB_PATH", "")  # empty = disabled
+ANALYTICS_SYNC_INTERVAL_SECONDS = int(os.getenv("ANALYTICS_SYNC_INTERVAL_SECONDS", "15"))
+ANALYTICS_SYNC_BATCH_ROWS = int(os.getenv("ANALYTICS_SYNC_BATCH_ROWS", "50000"))
+ANALYTICS_MAX_STALENESS_SECONDS = float(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "300"))
+ANALYTICS_STORE_ENABLED = DUCKDB_AVAILABLE and bool(ANALYTICS_DUCKDB_PATH)
+
+SYNC_TABLES = {
+    "network_logs": NetworkLog,
+    "feedback": Feedback,
+}
+
+analytics_metrics = {"syncs": 0, "rows_synced": {}, "last_sync": None, "generation": 0, "queries": 0}
+
+_connection = None
+_connection_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_last_sync: Optional[float] = None
+# The first run in a process may only note ids; answers are complete after the second
+_process_syncs = 0
+
+
+def _duckdb_type(column) -> str:
+    if isinstance(column.type, Integer):
+        return "BIGINT"
+    if isinstance(column.type, Float):
+        return "DOUBLE"
+    if isinstance(column.type, Boolean):
+        return "BOOLEAN"
+    if isinstance(column.type, DateTime):
+        return "TIMESTAMP"  # UTC, without zone (no ICU extension needed)
+    return "VARCHAR"
+
+
+def _utc_naive(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def connect(path: str = ANALYTICS_DUCKDB_PATH):
+    """The process-wide DuckDB connection (schema created on first use)"""
+    global _connection
+    with _connection_lock:
+        if _connection is None:
+            connection = duckdb.connect(path)
+            for table_name, model in SYNC_TABLES.items():
+                columns = ", ".join(f'"{col.name}" {_duckdb_type(col)}' for col in model.__table__.c)
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns})")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                "name VARCHAR PRIMARY KEY, last_id BIGINT NOT NULL, pending_id BIGINT NOT NULL, "
+                "synced_at TIMESTAMP)"
+            )
+            _connection = connection
+        return _connection
+
+
+def close():
+    global _connection
+    with _connection_lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+
+
+def _insert_rows(cursor, table_name: str, column_names: List[str], rows: List[tuple]):
+    if PYARROW_AVAILABLE:
+        # Columnar hand-off: DuckDB scans the Arrow table directly
+        batch = pa.table({
+            name: [_utc_naive(row[i]) for row in rows] for i, name in enumerate(column_names)
+        })
+        cursor.register("sync_batch", batch)
+        try:
+            cursor.execute(f"INSERT INTO {table_name} SELECT * FROM sync_batch")
+        finally:
+            cursor.unregister("sync_batch")
+    else:
+        placeholders = ", ".join("?" for _ in column_names)
+        cursor.executemany(
+            f"INSERT INTO {table_name} VALUES ({placeholders})",
+            [tuple(_utc_naive(value) for value in row) for row in rows]
+        )
+
+
+def sync_table(db, cursor, table_name: str) -> int:
+    """Copy rows with last_id < id <= pending_id, then remember the newest id"""
+    model = SYNC_TABLES[table_name]
+    table = model.__table__.c
+    state = cursor.execute(
+        "SELECT last_id, pending_id FROM sync_state WHERE name = ?", [table_name]
+    ).fetchone()
+    last_id, pending_id = state or (0, 0)
+    newest_id = db.execute(select(func.max(table.id))).scalar() or 0
+
+    rows = 0
+    column_names = [col.name for col in model.__table__.c]
+    cursor.execute("BEGIN TRANSACTION")
+    try:
+        if pending_id > last_id:
+            stmt = (
+                select(*model.__table__.c)
+                .where(table.id > last_id, table.id <= pending_id)
+                .order_by(table.id)
+                .execution_options(yield_per=ANALYTICS_SYNC_BATCH_ROWS)
+            )
+            for partition in db.execute(stmt).partitions():
+                _insert_rows(cursor, table_name, column_names, partition)
+                rows += len(partition)
+            last_id = pending_id
+        # Rows and watermark commit together, so a failed run is simply retried
+        cursor.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+            [table_name, last_id, max(newest_id, pending_id), datetime.utcnow()]
+        )
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def run_sync(session_factory=SessionLocal) -> Dict[str, int]:
+    """One micro-batch sync of all tables from the primary"""
+    global _last_sync, _process_syncs
+    if not ANALYTICS_STORE_ENABLED:
+        raise RuntimeError("Analytics replica is disabled (needs duckdb and ANALYTICS_DUCKDB_PATH)")
+    synced = {}
+    with _sync_lock:
+        cursor = connect().cursor()
+        db = session_factory()
+        try:
+            for table_name in SYNC_TABLES:
+                synced[table_name] = sync_table(db, cursor, table_name)
+        finally:
+            db.close()
+            cursor.close()
+        _process_syncs += 1
+        if _process_syncs >= 2:
+            _last_sync = time.monotonic()
+
+    analytics_metrics["syncs"] += 1
+    analytics_metrics["last_sync"] = datetime.now(timezone.utc).isoformat()
+    for table_name, rows in synced.items():
+        analytics_metrics["rows_synced"][table_name] = analytics_metrics["rows_synced"].get(table_name, 0) + rows
+    if any(synced.values()):
+        # Part of the analytics cache key: new rows mean new answers
+        analytics_metrics["generation"] += 1
+    return synced
+
+
+def is_ready() -> bool:
+    """Whether analytics queries should be answered by the replica"""
+    return (
+        ANALYTICS_STORE_ENABLED and _last_sync is not None
+        and time.monotonic() - _last_sync <= ANALYTICS_MAX_STALENESS_SECONDS
+    )
+
+
+def _query(sql: str, params: list) -> List[tuple]:
+    analytics_metrics["queries"] += 1
+    cursor = connect().cursor()
+    try:
+        return cursor.execute(sql, params).fetchall()
+    finally:
+        cursor.close()
+
+
+def get_provider_analytics(provider: str) -> List[Dict[str, Any]]:
+    """Same result as crud.get_provider_analytics, computed by DuckDB"""
+    rows = _query(
+        """
+        SELECT location,
+               avg(latency), avg(jitter), avg(packet_loss), avg(signal_strength),
+               avg(rating), sum(is_feedback)
+        FROM (
+            SELECT location, latency, jitter, packet_loss, signal_strength,
+                   NULL::DOUBLE AS rating, 0 AS is_feedback
+            FROM network_logs WHERE carrier = ?
+            UNION ALL
+            SELECT location, NULL, NULL, NULL, NULL, overall_satisfaction, 1
+            FROM feedback WHERE carrier = ?
+        )
+        GROUP BY location
+        ORDER BY location
+        """,
+        [provider, provider]
+    )
+
+    def rounded(value):
+        return round(float(value), 2) if value is not None else 0.0
+
+    return [
+        {
+            "location": location,
+            "avg_latency": rounded(latency),
+            "avg_jitter": rounded(jitter),
+            "avg_packet_loss": rounded(packet_loss),
+            "avg_signal_strength": rounded(signal_strength),
+            "avg_user_rating": rounded(rating),
+            "total_feedbacks": int(feedbacks or 0),
+        }
+        for location, latency, jitter, packet_loss, signal_strength, rating, feedbacks in rows
+    ]
+
+
+def store_status() -> Dict[str, Any]:
+    status = {"enabled": ANALYTICS_STORE_ENABLED, "ready": is_ready(), **analytics_metrics}
+    if ANALYTICS_STORE_ENABLED and _connection is not None:
+        cursor = _connection.cursor()
+        try:
+            status["watermarks"] = {
+                name: {"last_id": last_id, "synced_at": synced_at}
+                for name, last_id, synced_at in cursor.execute(
+                    "SELECT name, last_id, synced_at FROM sync_state"
+                ).fetchall()
+            }
+        finally:
+            cursor.close()
+    return status
+
+
+async def analytics_sync_worker():
+    """Background loop started by the API when the analytics replica is enabled"""
+    while True:
+        try:
+            synced = await run_in_threadpool(run_sync)
+            if any(synced.values()):
+                print(f"🦆 Synced {synced} rows into the analytics replica")
+        except Exception as e:
+            print(f"⚠️ Analytics sync failed: {e}")
+        await asyncio.sleep(ANALYTICS_SYNC_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    # Catch up manually; the second pass copies the ids the first one only noted
+    for _ in range(2):
+        print(f"🦆 {run_sync()}")
@@ -0,0 +1,283 @@
+"""
+Archival of old raw rows to compressed Parquet files on local disk.
+
+Rows of network_logs and feedback older than ARCHIVE_AFTER_DAYS are written
+to one zstd-compressed Parquet file per table, day and run:
+
+    {ARCHIVE_DIR}/{table}/date=YYYY-MM-DD/part-{run}.parquet
+
+and then deleted from the database in batches, keeping the hot tables (and
+their indexes) small. network_logs rows are only archived once the rollup
+job has processed them, so dashboards keep their history.
+
+A run is recorded in {ARCHIVE_DIR}/manifest.json as "written" before any
+row is deleted and as "complete" afterwards; an interrupted run is finished
+(deletes only) by the next one, so no row is archived twice or lost.
+
+rehydrate() copies a date range back into the database (same ids, so it is
+idempotent); rehydrated rows are skipped by later runs because their ids
+are already in the archive.
+
+Run manually with:  python archive.py
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select
+
+from database import SessionLocal
+from models import Feedback, NetworkLog, RollupWatermark
+from parquet_export import PYARROW_AVAILABLE, arrow_schema
+
+if PYARROW_AVAILABLE:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))  # 0 = archival disabled
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", str(24 * 3600)))
+ARCHIVE_CHUNK_ROWS = int(os.getenv("ARCHIVE_CHUNK_ROWS", "20000"))
+ARCHIVE_DELETE_BATCH = int(os.getenv("ARCHIVE_DELETE_BATCH", "5000"))
+
+ARCHIVE_TABLES = {
+    "network_logs": NetworkLog,
+    "feedback": Feedback,
+}
+
+
+def load_archive_manifest(archive_dir: str = ARCHIVE_DIR) -> Dict[str, Any]:
+    path = os.path.join(archive_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"tables": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest: Dict[str, Any], archive_dir: str):
+    path = os.path.join(archive_dir, "manifest.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _day(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).date().isoformat()
+
+
+def _archived_ids(archive_dir: str, files: List[Dict[str, Any]]) -> Set[int]:
+    """Ids already archived for one day (reads only the id column)"""
+    ids: Set[int] = set()
+    for entry in files:
+        table = pq.read_table(os.path.join(archive_dir, entry["path"]), columns=["id"])
+        ids.update(table.column("id").to_pylist())
+    return ids
+
+
+def _archive_condition(db, model, cutoff: datetime, snapshot_max_id: int) -> list:
+    table = model.__table__.c
+    clauses = [table.timestamp < cutoff, table.id <= snapshot_max_id]
+    if model is NetworkLog:
+        # Never archive logs the rollup job has not seen yet
+        rolled_up_id = db.execute(
+            select(RollupWatermark.last_id).where(RollupWatermark.name == "network_logs")
+        ).scalar() or 0
+        clauses.append(table.id <= rolled_up_id)
+    return clauses
+
+
+def _delete_ids(db, model, ids: List[int]) -> int:
+    """Delete archived rows by id, in batches"""
+    table = model.__table__
+    deleted = 0
+    for i in range(0, len(ids), ARCHIVE_DELETE_BATCH):
+        result = db.execute(delete(table).where(table.c.id.in_(ids[i:i + ARCHIVE_DELETE_BATCH])))
+        db.commit()
+        deleted += max(result.rowcount, 0)
+    return deleted
+
+
+def _run_ids(archive_dir: str, state: Dict[str, Any], run_id: str) -> List[int]:
+    return sorted(_archived_ids(archive_dir, [f for f in state["files"] if f["run_id"] == run_id]))
+
+
+def archive_table(db, table_name: str, manifest: Dict[str, Any], archive_dir: str,
+                  run_id: str, cutoff: datetime) -> Dict[str, Any]:
+    """Write rows older than cutoff to per-day Parquet files, then delete them"""
+    model = ARCHIVE_TABLES[table_name]
+    state = manifest["tables"].setdefault(table_name, {"files": [], "runs": []})
+
+    # Finish deletes of a run interrupted after its files were written
+    for run in state["runs"]:
+        if run["status"] == "written":
+            run["deleted"] = _delete_ids(db, model, _run_ids(archive_dir, state, run["run_id"]))
+            run["status"] = "complete"
+            _save_manifest(manifest, archive_dir)
+
+    table = model.__table__.c
+    snapshot_max_id = db.execute(select(func.max(table.id))).scalar() or 0
+    stmt = (
+        select(*model.__table__.c)
+        .where(*_archive_condition(db, model, cutoff, snapshot_max_id))
+        .order_by(table.timestamp, table.id)
+        .execution_options(yield_per=ARCHIVE_CHUNK_ROWS)
+    )
+
+    schema = arrow_schema(model, exclude=())
+    column_names = [col.name for col in model.__table__.c]
+    files_by_day: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in state["files"]:
+        files_by_day.setdefault(entry["date"], []).append(entry)
+
+    writers: Dict[str, Any] = {}
+    written: Dict[str, Dict[str, Any]] = {}
+    known_ids: Dict[str, Set[int]] = {}
+    # Exactly the rows now safe on disk; rows committed later are never touched
+    archived: List[int] = []
+    try:
+        for chunk in db.execute(stmt).partitions():
+            by_day: Dict[str, Dict[str, list]] = {}
+            for row in chunk:
+                day = _day(row.timestamp)
+                if day not in known_ids:
+                    known_ids[day] = _archived_ids(archive_dir, files_by_day.get(day, []))
+                archived.append(row.id)
+                if row.id in known_ids[day]:
+                    continue  # Rehydrated earlier; already in the archive
+                columns = by_day.get(day)
+                if columns is None:
+                    columns = by_day[day] = {name: [] for name in column_names}
+                for name, value in zip(column_names, row):
+                    columns[name].append(value)
+
+            for day, columns in by_day.items():
+                if day not in writers:
+                    path = os.path.join(table_name, f"date={day}", f"part-{run_id}.parquet")
+                    os.makedirs(os.path.join(archive_dir, os.path.dirname(path)), exist_ok=True)
+                    writers[day] = pq.ParquetWriter(os.path.join(archive_dir, path), schema, compression="zstd")
+                    written[day] = {"path": path, "date": day, "rows": 0, "min_id": min(columns["id"]),
+                                    "max_id": 0, "run_id": run_id}
+                writers[day].write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+                entry = written[day]
+                entry["rows"] += len(columns["id"])
+                entry["min_id"] = min(entry["min_id"], min(columns["id"]))
+                entry["max_id"] = max(entry["max_id"], max(columns["id"]))
+        for writer in writers.values():
+            writer.close()
+    except Exception:
+        for day, writer in writers.items():
+            writer.close()
+            os.remove(os.path.join(archive_dir, written[day]["path"]))
+        raise
+
+    if not archived:
+        return {"table": table_name, "rows": 0, "files": 0, "deleted": 0}
+
+    for entry in written.values():
+        entry["bytes"] = os.path.getsize(os.path.join(archive_dir, entry["path"]))
+        state["files"].append(entry)
+    run = {"run_id": run_id, "cutoff": cutoff.isoformat(), "status": "written"}
+    state["runs"].append(run)
+    # Files are recorded before anything is deleted
+    _save_manifest(manifest, archive_dir)
+
+    run["deleted"] = _delete_ids(db, model, archived)
+    run["status"] = "complete"
+    _save_manifest(manifest, archive_dir)
+    return {
+        "table": table_name,
+        "rows": sum(entry["rows"] for entry in written.values()),
+        "files": len(written),
+        "deleted": run["deleted"]
+    }
+
+
+def run_archive(archive_dir: str = ARCHIVE_DIR, after_days: int = ARCHIVE_AFTER_DAYS,
+                tables: Optional[List[str]] = None, session_factory=SessionLocal) -> Dict[str, Any]:
+    """Archive and delete rows older than after_days (whole UTC days)"""
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed")
+    if after_days <= 0:
+        raise ValueError("Archival is disabled (ARCHIVE_AFTER_DAYS must be > 0)")
+
+    os.makedirs(archive_dir, exist_ok=True)
+    manifest = load_archive_manifest(archive_dir)
+    now = datetime.now(timezone.utc)
+    cutoff = datetime.combine(now.date() - timedelta(days=after_days), time.min, tzinfo=timezone.utc)
+    # Unique per run, so a second run on the same day never overwrites a part file
+    run_id = f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    summary = {"run_id": run_id, "cutoff": cutoff.isoformat(), "tables": []}
+    db = session_factory()
+    try:
+        for table_name in tables or list(ARCHIVE_TABLES):
+            summary["tables"].append(archive_table(db, table_name, manifest, archive_dir, run_id, cutoff))
+    finally:
+        db.close()
+    return summary
+
+
+def rehydrate(table_name: str, since: date, until: date, archive_dir: str = ARCHIVE_DIR,
+              session_factory=SessionLocal) -> Dict[str, Any]:
+    """Copy archived rows with since <= day < until back into the database"""
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed")
+    if table_name not in ARCHIVE_TABLES:
+        raise ValueError(f"Unknown archive table: {table_name}")
+
+    model = ARCHIVE_TABLES[table_name]
+    manifest = load_archive_manifest(archive_dir)
+    files = [
+        entry for entry in manifest["tables"].get(table_name, {}).get("files", [])
+        if since.isoformat() <= entry["date"] < until.isoformat()
+    ]
+
+    db = session_factory()
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    restored = 0
+    try:
+        for entry in files:
+            parquet_file = pq.ParquetFile(os.path.join(archive_dir, entry["path"]))
+            for batch in parquet_file.iter_batches(batch_size=ARCHIVE_CHUNK_ROWS):
+                rows = batch.to_pylist()
+                # Ids are preserved, so rehydrating twice is a no-op
+                result = db.execute(insert(model.__table__).on_conflict_do_nothing(), rows)
+                restored += max(result.rowcount, 0)
+            db.commit()
+    finally:
+        db.close()
+    return {"table": table_name, "files": len(files), "rows_restored": restored}
+
+
+async def archive_worker():
+    """Background loop started by the API when ARCHIVE_AFTER_DAYS is set"""
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+        try:
+            summary = await run_in_threadpool(run_archive)
+            for table_summary in summary["tables"]:
+                if table_summary["deleted"]:
+                    print(f"🗄️ Archived {table_summary['rows']} {table_summary['table']} rows "
+                          f"into {table_summary['files']} files")
+        except Exception as e:
+            print(f"⚠️ Archive job failed: {e}")
+
+
+if __name__ == "__main__":
+    result = run_archive(after_days=ARCHIVE_AFTER_DAYS or 180)
+    for table_summary in result["tables"]:
+        print(f"🗄️ {table_summary['table']}: {table_summary['rows']} rows archived, "
+              f"{table_summary['deleted']} deleted")
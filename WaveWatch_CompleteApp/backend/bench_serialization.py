@@ -0,0 +1,79 @@
+"""
+Micro-benchmark: serialize / deserialize a 10k-row network log list payload.
+
+Compares the previous path (jsonable_encoder + stdlib json) with orjson and
+the Pydantic v2 TypeAdapter used by the list endpoints.
+
+Run with:  python bench_serialization.py [rows]
+"""
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from serialization import ORJSON_AVAILABLE, network_log_list
+
+if ORJSON_AVAILABLE:
+    import orjson
+
+
+def make_rows(count: int) -> list:
+    start = datetime(2024, 1, 1)
+    carriers = ["MTN", "Orange", "Nexttel", "Camtel"]
+    return [
+        {
+            "id": i,
+            "user_id": 1,
+            "carrier": carriers[i % len(carriers)],
+            "network_type": "4G",
+            "signal_strength": -70 - i % 30,
+            "download_speed": 12.5 + i % 50,
+            "upload_speed": 3.25 + i % 10,
+            "latency": 40 + i % 100,
+            "jitter": 2.5,
+            "packet_loss": 0.1,
+            "location": "Buea, Cameroon",
+            "timestamp": start + timedelta(seconds=i),
+            "device_info": "Flutter App",
+            "app_version": "1.0.0",
+            "device_id": None,
+            "local_id": None,
+        }
+        for i in range(count)
+    ]
+
+
+def bench(label: str, fn, repeat: int = 5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<42} {best * 1000:9.2f} ms")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rows = make_rows(count)
+    print(f"📊 Serialization benchmark ({count} rows, best of 5)")
+
+    print("\nSerialize:")
+    payload = bench("jsonable_encoder + json.dumps", lambda: json.dumps(jsonable_encoder(rows)).encode())
+    bench("TypeAdapter validate + dump_json", lambda: network_log_list.dump_json(network_log_list.validate_python(rows)))
+    if ORJSON_AVAILABLE:
+        bench("orjson.dumps", lambda: orjson.dumps(rows))
+        bench("jsonable_encoder + orjson.dumps", lambda: orjson.dumps(jsonable_encoder(rows)))
+
+    print(f"\nDeserialize ({len(payload) / 1024:.0f} KB):")
+    bench("json.loads", lambda: json.loads(payload))
+    if ORJSON_AVAILABLE:
+        bench("orjson.loads", lambda: orjson.loads(payload))
+    bench("TypeAdapter.validate_json", lambda: network_log_list.validate_json(payload))
+
+
+if __name__ == "__main__":
+    main()
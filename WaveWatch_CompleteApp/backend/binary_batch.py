@@ -0,0 +1,338 @@
+"""
+Compact binary batch format for uploading a device's network log backlog.
+
+A backlog is a time series from one device with a handful of distinct
+carriers/locations and slowly changing metrics, so it is stored column by
+column: strings become indexes into per-batch dictionaries and numbers are
+delta encoded as variable-length integers. Typical batches are 10-20x
+smaller than the same records posted as JSON, and the server decodes them
+into column lists without building a dict per record.
+
+Layout (all integers are unsigned LEB128 varints unless noted):
+
+    magic       4 bytes   b"WWB1"
+    version     1 byte    1
+    count       varint    number of records N
+    header      3 strings device_id, device_info, app_version
+                          (shared by every record; empty = not set)
+    dictionaries          for carrier, network_type, location in that order:
+                          varint K, then K strings
+    columns               for each column of COLUMNS in order:
+                          presence byte: 0 = no values, 1 = a value for every
+                          record, 2 = bitmap of ceil(N/8) bytes follows
+                          (bit i, LSB first, set when record i has a value);
+                          then one varint per present value
+
+    string      varint byte length + UTF-8 bytes
+
+Column values:
+
+    timestamp       milliseconds since the Unix epoch (UTC), zigzag delta
+    carrier, network_type, location
+                    index into the column's dictionary (not delta encoded)
+    signal_strength, latency, local_id
+                    integers, zigzag delta
+    download_speed, upload_speed, jitter, packet_loss
+                    quantized to 0.01 (value * 100 rounded), zigzag delta
+
+Deltas are taken between consecutive present values of the same column,
+starting from 0. timestamp, carrier and location are required for every
+record. local_id (with the header device_id) is the idempotency key used by
+the other ingest endpoints; it must be an integer in this format.
+
+Run `python binary_batch.py` to compare sizes with JSON on a synthetic backlog.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+MAGIC = b"WWB1"
+FORMAT_VERSION = 1
+BATCH_MEDIA_TYPE = "application/vnd.wavewatch.batch"
+
+# Upper bound on records per batch, checked before any column is allocated
+MAX_BATCH_RECORDS = int(os.getenv("MAX_BATCH_RECORDS", "100000"))
+
+PRESENCE_NONE = 0
+PRESENCE_ALL = 1
+PRESENCE_BITMAP = 2
+
+HEADER_FIELDS = ("device_id", "device_info", "app_version")
+DICTIONARY_FIELDS = ("carrier", "network_type", "location")
+
+# (column, kind, scale) in wire order
+COLUMNS = (
+    ("timestamp", "time", 1),
+    ("carrier", "dict", 1),
+    ("network_type", "dict", 1),
+    ("location", "dict", 1),
+    ("signal_strength", "int", 1),
+    ("download_speed", "float", 100),
+    ("upload_speed", "float", 100),
+    ("latency", "int", 1),
+    ("jitter", "float", 100),
+    ("packet_loss", "float", 100),
+    ("local_id", "id", 1),
+)
+REQUIRED_COLUMNS = {"timestamp", "carrier", "location"}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class BinaryBatchError(ValueError):
+    """Raised for malformed or oversized binary batches"""
+
+
+class DecodedBatch:
+    """Column lists of a decoded batch; columns[name][i] is record i's value or None"""
+
+    __slots__ = ("count", "header", "columns")
+
+    def __init__(self, count: int, header: Dict[str, Optional[str]], columns: Dict[str, List[Any]]):
+        self.count = count
+        self.header = header
+        self.columns = columns
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Per-record dicts, only for the in-memory fallback store"""
+        header = {name: value for name, value in self.header.items() if value is not None}
+        names = [name for name, values in self.columns.items() if any(v is not None for v in values)]
+        for i in range(self.count):
+            record = {name: self.columns[name][i] for name in names if self.columns[name][i] is not None}
+            record.update(header)
+            yield record
+
+
+def is_binary_batch(content_type: str) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() == BATCH_MEDIA_TYPE
+
+
+# Decoding
+
+class _Reader:
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def take(self, length: int) -> bytes:
+        end = self.pos + length
+        if end > len(self.data):
+            raise BinaryBatchError("Truncated batch")
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+
+    def varint(self) -> int:
+        data, pos = self.data, self.pos
+        result = shift = 0
+        while True:
+            if pos >= len(data):
+                raise BinaryBatchError("Truncated varint")
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+            if shift > 63:
+                raise BinaryBatchError("Varint longer than 64 bits")
+        self.pos = pos
+        return result
+
+    def zigzag(self) -> int:
+        value = self.varint()
+        return (value >> 1) ^ -(value & 1)
+
+    def string(self) -> str:
+        try:
+            return self.take(self.varint()).decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise BinaryBatchError(f"Invalid UTF-8 string: {e}")
+
+
+def _present_rows(reader: _Reader, count: int, name: str) -> Sequence[int]:
+    mode = reader.take(1)[0]
+    if mode == PRESENCE_NONE:
+        present = ()
+    elif mode == PRESENCE_ALL:
+        present = range(count)
+    elif mode == PRESENCE_BITMAP:
+        bitmap = reader.take((count + 7) // 8)
+        present = [i for i in range(count) if bitmap[i >> 3] & (1 << (i & 7))]
+    else:
+        raise BinaryBatchError(f"Unknown presence mode {mode} for {name}")
+    if name in REQUIRED_COLUMNS and len(present) != count:
+        raise BinaryBatchError(f"{name} is required for every record")
+    return present
+
+
+def _read_column(reader: _Reader, count: int, name: str, kind: str, scale: int,
+                 dictionary: Optional[List[str]]) -> List[Any]:
+    present = _present_rows(reader, count, name)
+    values: List[Any] = [None] * count
+    if kind == "dict":
+        size = len(dictionary)
+        for i in present:
+            index = reader.varint()
+            if index >= size:
+                raise BinaryBatchError(f"{name} index {index} outside dictionary of {size}")
+            values[i] = dictionary[index]
+        return values
+
+    previous = 0
+    for i in present:
+        previous += reader.zigzag()
+        values[i] = previous
+    if kind == "time":
+        try:
+            return [datetime.fromtimestamp(v / 1000, tz=timezone.utc) for v in values]
+        except (OverflowError, OSError, ValueError) as e:
+            raise BinaryBatchError(f"Timestamp out of range: {e}")
+    if kind == "float":
+        return [v / scale if v is not None else None for v in values]
+    if kind == "id":
+        return [str(v) if v is not None else None for v in values]
+    return values
+
+
+def decode_batch(data: bytes) -> DecodedBatch:
+    """Decode a binary batch into column lists (see module docstring for the layout)"""
+    reader = _Reader(data)
+    if reader.take(4) != MAGIC:
+        raise BinaryBatchError("Not a WaveWatch batch (bad magic)")
+    version = reader.take(1)[0]
+    if version != FORMAT_VERSION:
+        raise BinaryBatchError(f"Unsupported batch version {version}")
+
+    count = reader.varint()
+    if count > MAX_BATCH_RECORDS:
+        raise BinaryBatchError(f"Batch of {count} records exceeds {MAX_BATCH_RECORDS}")
+
+    header = {name: (reader.string() or None) for name in HEADER_FIELDS}
+    dictionaries = {}
+    for name in DICTIONARY_FIELDS:
+        size = reader.varint()
+        if size > count:
+            raise BinaryBatchError(f"{name} dictionary larger than the batch")
+        dictionaries[name] = [reader.string() for _ in range(size)]
+
+    columns = {
+        name: _read_column(reader, count, name, kind, scale, dictionaries.get(name))
+        for name, kind, scale in COLUMNS
+    }
+    if reader.pos != len(data):
+        raise BinaryBatchError(f"{len(data) - reader.pos} trailing bytes after batch")
+    return DecodedBatch(count, header, columns)
+
+
+# Encoding (reference implementation of the client side)
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_zigzag(out: bytearray, value: int):
+    _write_varint(out, value << 1 if value >= 0 else ((-value) << 1) - 1)
+
+
+def _write_string(out: bytearray, value: Optional[str]):
+    encoded = (value or "").encode("utf-8")
+    _write_varint(out, len(encoded))
+    out += encoded
+
+
+def _epoch_millis(value) -> int:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return round((value - _EPOCH).total_seconds() * 1000)
+
+
+def encode_batch(records: List[Dict[str, Any]], device_id: Optional[str] = None,
+                 device_info: Optional[str] = None, app_version: Optional[str] = None) -> bytes:
+    """Encode network log dicts from one device into a binary batch"""
+    count = len(records)
+    out = bytearray(MAGIC)
+    out.append(FORMAT_VERSION)
+    _write_varint(out, count)
+    for value in (device_id, device_info, app_version):
+        _write_string(out, value)
+
+    indexes: Dict[str, Dict[str, int]] = {}
+    for name in DICTIONARY_FIELDS:
+        index = indexes[name] = {}
+        for record in records:
+            value = record.get(name)
+            if value is not None and value not in index:
+                index[value] = len(index)
+        _write_varint(out, len(index))
+        for value in index:
+            _write_string(out, value)
+
+    for name, kind, scale in COLUMNS:
+        values = [record.get(name) for record in records]
+        present = [i for i, value in enumerate(values) if value is not None]
+        if not present:
+            out.append(PRESENCE_NONE)
+            continue
+        if len(present) == count:
+            out.append(PRESENCE_ALL)
+        else:
+            out.append(PRESENCE_BITMAP)
+            bitmap = bytearray((count + 7) // 8)
+            for i in present:
+                bitmap[i >> 3] |= 1 << (i & 7)
+            out += bitmap
+
+        if kind == "dict":
+            for i in present:
+                _write_varint(out, indexes[name][values[i]])
+            continue
+        previous = 0
+        for i in present:
+            if kind == "time":
+                current = _epoch_millis(values[i])
+            elif kind == "float":
+                current = round(values[i] * scale)
+            else:
+                current = int(values[i])
+            _write_zigzag(out, current - previous)
+            previous = current
+    return bytes(out)
+
+
+if __name__ == "__main__":
+    import json
+    import zlib
+    from datetime import timedelta
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    backlog = [
+        {
+            "timestamp": (start + timedelta(seconds=30 * i)).isoformat(),
+            "carrier": "MTN" if i % 50 else "Orange",
+            "network_type": "4G",
+            "location": "Buea, Cameroon",
+            "signal_strength": -75 + i % 5,
+            "download_speed": round(12.5 + (i % 7) * 0.25, 2),
+            "upload_speed": round(3.1 + (i % 3) * 0.1, 2),
+            "latency": 45 + i % 10,
+            "jitter": 2.5,
+            "packet_loss": 0.0,
+            "local_id": str(i + 1),
+        }
+        for i in range(5000)
+    ]
+    binary = encode_batch(backlog, device_id="device-1", device_info="Flutter App", app_version="1.0.0")
+    json_posts = sum(len(json.dumps({**r, "device_id": "device-1", "device_info": "Flutter App",
+                                     "app_version": "1.0.0"})) for r in backlog)
+    print(f"📦 {len(backlog)} records")
+    print(f"  per-row JSON posts: {json_posts:>9} bytes")
+    print(f"  binary batch:       {len(binary):>9} bytes ({json_posts / len(binary):.1f}x smaller)")
+    print(f"  binary batch gzip:  {len(zlib.compress(binary, 9)):>9} bytes")
@@ -0,0 +1,218 @@
+"""
+Response compression (gzip / brotli).
+
+CompressionMiddleware compresses every response whose client accepts it:
+complete bodies only above COMPRESSION_MIN_BYTES, and StreamingResponse
+bodies (exports) chunk by chunk with a flush after each chunk so rows keep
+arriving incrementally. Responses that already carry a Content-Encoding are
+passed through untouched, which is how cached responses hand over their
+precompressed bytes (see PrecompressedBody).
+
+brotli is optional; without it only gzip is offered.
+"""
+import gzip
+import os
+import threading
+import zlib
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+# brotli is optional
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+    print("⚠️ brotli library not available, using gzip only")
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# Bodies that are already compressed or not worth compressing
+SKIP_MEDIA_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip",
+                    "application/zstd", "application/vnd.apache.parquet")
+
+compression_metrics = {"compressed": 0, "streamed": 0, "skipped_small": 0,
+                       "bytes_in": 0, "bytes_out": 0, "by_encoding": {}}
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported encoding from an Accept-Encoding header, br over gzip on ties"""
+    qualities = {}
+    for entry in accept_encoding.split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        name = parts[0].lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    candidates = (["br"] if BROTLI_AVAILABLE else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for name in candidates:
+        quality = qualities.get(name, wildcard)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class _StreamCompressor:
+    """Incremental compressor that flushes after every chunk"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+def _record(encoding: str, bytes_in: int, bytes_out: int):
+    compression_metrics["bytes_in"] += bytes_in
+    compression_metrics["bytes_out"] += bytes_out
+    by_encoding = compression_metrics["by_encoding"]
+    by_encoding[encoding] = by_encoding.get(encoding, 0) + 1
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware: compresses complete and streaming response bodies"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.passthrough = False
+        self.compressor: Optional[_StreamCompressor] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk tells us whether to compress
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            if "content-encoding" in headers or content_type.startswith(SKIP_MEDIA_TYPES):
+                self.passthrough = True
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None and not more_body:
+            # Complete body in one message
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            if len(body) < self.minimum_size:
+                compression_metrics["skipped_small"] += 1
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            compressed = compress(body, self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            compression_metrics["compressed"] += 1
+            _record(self.encoding, len(body), len(compressed))
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": compressed})
+            return
+
+        if self.compressor is None:
+            # Streaming body: size unknown, always compress
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            self.compressor = _StreamCompressor(self.encoding)
+            compression_metrics["streamed"] += 1
+            await self.send(self.start_message)
+
+        data = self.compressor.chunk(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        if not more_body:
+            _record(self.encoding, self.bytes_in, self.bytes_out)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+class PrecompressedBody:
+    """Serialized body of a cached response plus its compressed variants.
+
+    Each encoding is compressed at most once per cached body, so repeated
+    hits on a cached aggregate cost no compression work.
+    """
+
+    def __init__(self, body: bytes, media_type: str, headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.media_type = media_type
+        self.headers = dict(headers or {})
+        self._variants: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding: str) -> bytes:
+        with self._lock:
+            data = self._variants.get(encoding)
+            if data is None:
+                data = self._variants[encoding] = compress(self.body, encoding)
+            return data
+
+    def response(self, request: Request) -> Response:
+        headers = dict(self.headers)
+        headers["Vary"] = ", ".join(filter(None, [headers.get("Vary"), "Accept-Encoding"]))
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        if encoding is None or len(self.body) < COMPRESSION_MIN_BYTES:
+            return Response(content=self.body, media_type=self.media_type, headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(content=self.variant(encoding), media_type=self.media_type, headers=headers)
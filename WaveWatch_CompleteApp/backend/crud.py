@@ -1,10 +1,17 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import (
+    func, desc, insert, select, text, tuple_, union_all, literal, null, Select, Integer, Float, DateTime
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from passlib.context import CryptContext
 from models import User, Feedback, NetworkLog
 from schemas import UserCreate, FeedbackCreate, NetworkLogCreate
-from typing import List, Optional
-import statistics
+from dedup import IdempotencyIndex, network_log_keys, feedback_keys
+from dimensions import DictionaryEncoded, encode_values
+from response_cache import aggregate_versions
+from typing import List, Optional, Dict, Tuple
+from datetime import datetime
+from itertools import repeat
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -14,22 +21,42 @@ def get_password_hash(password):
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def _dialect_insert(db: Session, model):
+    """INSERT construct with ON CONFLICT support for the bound database"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return insert(model)
+
 # User CRUD operations
 def get_user_by_username(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
-def create_user(db: Session, user: UserCreate):
+# Columns returned to clients; never includes hashed_password
+USER_PUBLIC_COLUMNS = (User.id, User.username, User.email, User.provider, User.created_at, User.is_active)
+
+def create_user(db: Session, user: UserCreate) -> Optional[dict]:
+    """Insert a user in a single round trip.
+
+    Username uniqueness is left to the unique index (ON CONFLICT DO NOTHING)
+    instead of a pre-check query; returns None when the username is taken.
+    Server defaults (id, created_at) come back through RETURNING.
+    """
     hashed_password = get_password_hash(user.password)
-    db_user = User(
+    stmt = _dialect_insert(db, User).values(
         username=user.username,
         email=user.email,
         hashed_password=hashed_password,
-        provider=user.provider
+        provider=user.provider,
+        is_active=True
     )
-    db.add(db_user)
+    if hasattr(stmt, "on_conflict_do_nothing"):
+        stmt = stmt.on_conflict_do_nothing(index_elements=["username"])
+    row = db.execute(stmt.returning(*USER_PUBLIC_COLUMNS)).mappings().first()
     db.commit()
-    db.refresh(db_user)
-    return db_user
+    return dict(row) if row else None
 
 def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
@@ -40,121 +67,398 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 # Feedback CRUD operations
-def create_feedback(db: Session, feedback: FeedbackCreate, user_id: int):
-    db_feedback = Feedback(**feedback.dict(), user_id=user_id)
-    db.add(db_feedback)
+def create_feedback(db: Session, feedback: FeedbackCreate, user_id: int) -> dict:
+    """Insert feedback and get server defaults back via RETURNING (no refresh SELECT)"""
+    stmt = insert(Feedback).values(**feedback.model_dump(exclude_none=True), user_id=user_id)
+    row = db.execute(stmt.returning(*Feedback.__table__.c)).mappings().one()
     db.commit()
-    db.refresh(db_feedback)
-    return db_feedback
+    aggregate_versions.bump([(row["location"], row["carrier"])])
+    return dict(row)
 
-def get_feedbacks(db: Session, user_id: Optional[int] = None, skip: int = 0, limit: int = 100):
-    query = db.query(Feedback)
-    if user_id:
-        query = query.filter(Feedback.user_id == user_id)
-    return query.offset(skip).limit(limit).all()
+def get_feedbacks(db: Session, user_id: Optional[int] = None, skip: int = 0, limit: int = 100,
+                  **filters) -> List[dict]:
+    """List feedback as plain dicts via the Core read path (no ORM hydration)"""
+    stmt = select_feedbacks(user_id=user_id, **filters).offset(skip).limit(limit)
+    return [dict(row) for row in db.execute(stmt).mappings()]
 
 # Network Log CRUD operations
-def create_network_log(db: Session, log: NetworkLogCreate, user_id: int):
-    db_log = NetworkLog(**log.dict(), user_id=user_id)
-    db.add(db_log)
+def create_network_log(db: Session, log: NetworkLogCreate, user_id: int) -> dict:
+    """Insert a network log and get server defaults back via RETURNING (no refresh SELECT)"""
+    stmt = insert(NetworkLog).values(**log.model_dump(exclude_none=True), user_id=user_id)
+    row = db.execute(stmt.returning(*NetworkLog.__table__.c)).mappings().one()
     db.commit()
-    db.refresh(db_log)
-    return db_log
+    aggregate_versions.bump([(row["location"], row["carrier"])])
+    return dict(row)
 
-def get_network_logs(db: Session, user_id: Optional[int] = None, skip: int = 0, limit: int = 100):
-    query = db.query(NetworkLog)
+def create_network_logs_bulk(db: Session, logs: List[dict], user_id: int) -> List[dict]:
+    """Insert a chunk of already-validated logs, skipping retried duplicates"""
+    return ingest_idempotent(db, NetworkLog, logs, user_id, network_log_keys)
+
+def create_feedbacks_bulk(db: Session, feedbacks: List[dict], user_id: int) -> List[dict]:
+    """Insert a chunk of already-validated feedback, skipping retried duplicates"""
+    return ingest_idempotent(db, Feedback, feedbacks, user_id, feedback_keys)
+
+def get_network_logs(db: Session, user_id: Optional[int] = None, skip: int = 0, limit: int = 100,
+                     **filters) -> List[dict]:
+    """List network logs as plain dicts via the Core read path (no ORM hydration)"""
+    stmt = select_network_logs(user_id=user_id, **filters).offset(skip).limit(limit)
+    return [dict(row) for row in db.execute(stmt).mappings()]
+
+# Core read path shared by list, export and analytics endpoints.
+# Selecting table columns (not entities) returns lightweight Row tuples with
+# no identity map, change tracking or relationship loading.
+def _read_filters(model, user_id: Optional[int] = None, carrier: Optional[str] = None,
+                  location: Optional[str] = None, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None) -> list:
+    clauses = []
     if user_id:
-        query = query.filter(NetworkLog.user_id == user_id)
-    return query.order_by(desc(NetworkLog.timestamp)).offset(skip).limit(limit).all()
+        clauses.append(model.user_id == user_id)
+    if carrier:
+        clauses.append(model.carrier == carrier)
+    if location:
+        clauses.append(model.location.ilike(f"%{location}%"))
+    if since:
+        clauses.append(model.timestamp >= since)
+    if until:
+        clauses.append(model.timestamp < until)
+    return clauses
+
+def select_network_logs(**filters) -> Select:
+    return (
+        select(*NetworkLog.__table__.c)
+        .where(*_read_filters(NetworkLog.__table__.c, **filters))
+        .order_by(desc(NetworkLog.__table__.c.timestamp))
+    )
+
+def select_feedbacks(**filters) -> Select:
+    return (
+        select(*Feedback.__table__.c)
+        .where(*_read_filters(Feedback.__table__.c, **filters))
+        .order_by(desc(Feedback.__table__.c.timestamp))
+    )
+
+# Idempotent ingestion
+def _idempotency_key(record: dict) -> Optional[Tuple[str, str]]:
+    device_id, local_id = record.get("device_id"), record.get("local_id")
+    if device_id is None or local_id is None:
+        return None
+    return (str(device_id), str(local_id))
+
+def _lookup_keys(db: Session, model, keys) -> Dict[Tuple[str, str], dict]:
+    """Fetch id/timestamp of already stored rows for the given idempotency keys"""
+    keys = list(keys)
+    found = {}
+    for i in range(0, len(keys), 500):
+        rows = db.execute(
+            select(model.id, model.timestamp, model.device_id, model.local_id)
+            .where(tuple_(model.device_id, model.local_id).in_(keys[i:i + 500]))
+        )
+        for row in rows:
+            found[(row.device_id, row.local_id)] = {"id": row.id, "timestamp": row.timestamp}
+    return found
+
+def ingest_idempotent(db: Session, model, records: List[dict], user_id: int,
+                      key_index: IdempotencyIndex) -> List[dict]:
+    """Insert records once per (device_id, local_id) idempotency key.
+
+    Returns one ``{"id", "timestamp", "duplicate"}`` entry per input record,
+    in input order. Retries are acknowledged with the id of the original row.
+    The unique index is authoritative; key_index only saves queries: an LRU
+    hit answers without the database, and a Bloom-filter miss means the key
+    is new so no lookup is issued before the insert.
+    """
+    results: List[Optional[dict]] = [None] * len(records)
+    first_position: Dict[Tuple[str, str], int] = {}
+    repeats: List[Tuple[int, int]] = []  # (position, position of first occurrence)
+    to_check: Dict[Tuple[str, str], int] = {}
+    to_insert: List[int] = []
+    learned: List[Tuple[Tuple[str, str], int]] = []  # fed to key_index after commit
+
+    for pos, record in enumerate(records):
+        key = _idempotency_key(record)
+        if key is None:
+            to_insert.append(pos)
+            continue
+        if key in first_position:
+            repeats.append((pos, first_position[key]))
+            continue
+        first_position[key] = pos
+        row_id = key_index.known_id(key)
+        if row_id is not None:
+            results[pos] = {"id": row_id, "timestamp": None, "duplicate": True}
+        elif key_index.maybe_seen(key):
+            to_check[key] = pos
+        else:
+            to_insert.append(pos)
+
+    if to_check:
+        existing = _lookup_keys(db, model, to_check.keys())
+        for key, pos in to_check.items():
+            if key in existing:
+                results[pos] = {**existing[key], "duplicate": True}
+                learned.append((key, existing[key]["id"]))
+            else:
+                to_insert.append(pos)
+
+    # Group by column set so rows relying on server defaults stay in their own executemany
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for pos in sorted(to_insert):
+        groups.setdefault(tuple(sorted(records[pos])), []).append(pos)
+
+    conflicted = {}
+    for columns, positions in groups.items():
+        params = [{**records[pos], "user_id": user_id} for pos in positions]
+        keyed = "device_id" in columns and "local_id" in columns
+        stmt = _dialect_insert(db, model)
+        if keyed and hasattr(stmt, "on_conflict_do_nothing"):
+            # No conflict target: on a partitioned network_logs the unique
+            # index is (device_id, local_id, timestamp) instead
+            stmt = stmt.on_conflict_do_nothing()
+            returned = db.execute(
+                stmt.returning(model.id, model.timestamp, model.device_id, model.local_id), params
+            )
+            stored = {(row.device_id, row.local_id): row for row in returned}
+            for pos in positions:
+                key = _idempotency_key(records[pos])
+                row = stored.get(key)
+                if row is None:
+                    # Stored before this process started; resolved below
+                    conflicted[key] = pos
+                    continue
+                results[pos] = {"id": row.id, "timestamp": row.timestamp, "duplicate": False}
+                learned.append((key, row.id))
+        else:
+            returned = db.execute(
+                stmt.returning(model.id, model.timestamp, sort_by_parameter_order=True), params
+            )
+            for pos, row in zip(positions, returned):
+                results[pos] = {"id": row.id, "timestamp": row.timestamp, "duplicate": False}
+
+    if conflicted:
+        existing = _lookup_keys(db, model, conflicted.keys())
+        for key, pos in conflicted.items():
+            results[pos] = {**existing[key], "duplicate": True}
+            learned.append((key, existing[key]["id"]))
+
+    for pos, first in repeats:
+        results[pos] = {**results[first], "duplicate": True}
+
+    db.commit()
+    for key, row_id in learned:
+        key_index.remember(key, row_id)
+    aggregate_versions.bump(
+        (records[pos].get("location"), records[pos].get("carrier"))
+        for pos, result in enumerate(results) if not result["duplicate"]
+    )
+    return results
+
+# Columnar ingestion for binary batches
+_ARRAY_TYPES = {Integer: "INTEGER[]", Float: "DOUBLE PRECISION[]", DateTime: "TIMESTAMPTZ[]"}
+
+def _array_type(column) -> str:
+    if isinstance(column.type, DictionaryEncoded):
+        return "INTEGER[]"
+    for sql_type, array_type in _ARRAY_TYPES.items():
+        if isinstance(column.type, sql_type):
+            return array_type
+    return "TEXT[]"
+
+def create_network_logs_columnar(db: Session, columns: Dict[str, list], constants: Dict[str, Optional[str]],
+                                 user_id: int) -> Dict[str, int]:
+    """Insert a decoded binary batch straight from its column lists.
+
+    constants holds values shared by every row (device_id, device_info,
+    app_version). On PostgreSQL the whole batch is one INSERT ... SELECT FROM
+    unnest(arrays); elsewhere it is a driver-level executemany over row
+    tuples. Either way no per-row dict is built. Rows hitting the idempotency
+    unique index are skipped and counted as duplicates.
+    """
+    count = len(next(iter(columns.values()), []))
+    if count == 0:
+        return {"inserted": 0, "duplicates": 0}
+
+    table = NetworkLog.__table__
+    shared = {"user_id": user_id, **constants}
+    names = list(shared) + list(columns)
+    column_list = ", ".join(table.c[name].name for name in names)
+    conflict = "ON CONFLICT DO NOTHING"
+    dialect = db.get_bind().dialect
+
+    if dialect.name == "postgresql":
+        arrays = ", ".join(f"CAST(:{name} AS {_array_type(table.c[name])})" for name in columns)
+        shared_values = ", ".join(f":{name}" for name in shared)
+        stmt = text(
+            f"INSERT INTO {table.name} ({column_list}) "
+            f"SELECT {shared_values}, batch.* FROM unnest({arrays}) AS batch "
+            f"{conflict} RETURNING id, local_id"
+        )
+        # text() skips type processing: dictionary-encoded columns go in as ids
+        params = {**shared, **columns}
+        for name, value in params.items():
+            column = table.c[name]
+            if isinstance(column.type, DictionaryEncoded):
+                params[name] = encode_values(column, value) if name in columns else encode_values(column, [value])[0]
+        stored = db.execute(stmt, params).all()
+        db.commit()
+        device_id = constants.get("device_id")
+        if device_id is not None:
+            for row in stored:
+                if row.local_id is not None:
+                    network_log_keys.remember((device_id, row.local_id), row.id)
+        inserted = len(stored)
+    else:
+        # Apply SQLAlchemy's bind processing (e.g. SQLite datetime strings,
+        # dimension ids) per column and to the shared values
+        prepared = []
+        for name in columns:
+            processor = table.c[name].type.dialect_impl(dialect).bind_processor(dialect)
+            values = columns[name]
+            prepared.append([processor(value) for value in values] if processor else values)
+        for name, value in shared.items():
+            processor = table.c[name].type.dialect_impl(dialect).bind_processor(dialect)
+            if processor:
+                shared[name] = processor(value)
+        placeholder = "%s" if dialect.paramstyle in ("format", "pyformat") else "?"
+        stmt = (
+            f"INSERT INTO {table.name} ({column_list}) "
+            f"VALUES ({', '.join([placeholder] * len(names))}) {conflict}"
+        )
+        rows = zip(*(repeat(value, count) for value in shared.values()), *prepared)
+        result = db.connection().exec_driver_sql(stmt, list(rows))
+        db.commit()
+        inserted = result.rowcount
+
+    if inserted:
+        aggregate_versions.bump(zip(columns["location"], columns["carrier"]))
+    return {"inserted": inserted, "duplicates": count - inserted}
 
 # Recommendation logic
 def get_provider_recommendations(db: Session, location: str):
-    # Get all network logs for the specified location
-    logs = db.query(NetworkLog).filter(
-        NetworkLog.location.ilike(f"%{location}%")
-    ).all()
-    
-    if not logs:
-        return []
-    
-    # Group by carrier and calculate metrics
-    carrier_metrics = {}
-    
-    for log in logs:
-        if log.carrier not in carrier_metrics:
-            carrier_metrics[log.carrier] = {
-                'download_speeds': [],
-                'upload_speeds': [],
-                'latencies': [],
-                'signal_strengths': [],
-                'total_samples': 0
-            }
-        
-        metrics = carrier_metrics[log.carrier]
-        metrics['total_samples'] += 1
-        
-        if log.download_speed:
-            metrics['download_speeds'].append(log.download_speed)
-        if log.upload_speed:
-            metrics['upload_speeds'].append(log.upload_speed)
-        if log.latency:
-            metrics['latencies'].append(log.latency)
-        if log.signal_strength:
-            metrics['signal_strengths'].append(log.signal_strength)
+    # Aggregate per carrier in the database instead of loading every log.
+    # NULLIF(x, 0) keeps the old behaviour of ignoring missing/zero readings.
+    logs = NetworkLog.__table__.c
+    stmt = (
+        select(
+            logs.carrier,
+            func.count().label("total_samples"),
+            func.avg(func.nullif(logs.download_speed, 0)).label("avg_download"),
+            func.avg(func.nullif(logs.upload_speed, 0)).label("avg_upload"),
+            func.avg(func.nullif(logs.latency, 0)).label("avg_latency"),
+            func.avg(func.nullif(logs.signal_strength, 0)).label("avg_signal"),
+        )
+        .where(logs.location.ilike(f"%{location}%"))
+        .group_by(logs.carrier)
+        .having(func.count() >= 3)  # Need minimum samples
+    )
     
     # Calculate recommendations
     recommendations = []
     
-    for carrier, metrics in carrier_metrics.items():
-        if metrics['total_samples'] < 3:  # Need minimum samples
-            continue
-            
+    for row in db.execute(stmt):
         # Calculate averages
-        avg_download = statistics.mean(metrics['download_speeds']) if metrics['download_speeds'] else 0
-        avg_upload = statistics.mean(metrics['upload_speeds']) if metrics['upload_speeds'] else 0
-        avg_latency = statistics.mean(metrics['latencies']) if metrics['latencies'] else 999
-        avg_signal = statistics.mean(metrics['signal_strengths']) if metrics['signal_strengths'] else -100
-        
-        # Calculate score (higher is better)
-        # Normalize metrics and combine them
-        download_score = min(avg_download / 100, 1.0) * 40  # Max 40 points
-        upload_score = min(avg_upload / 50, 1.0) * 20       # Max 20 points
-        latency_score = max(0, (200 - avg_latency) / 200) * 25  # Max 25 points (lower latency is better)
-        signal_score = max(0, (avg_signal + 120) / 70) * 15     # Max 15 points (higher signal is better)
-        
-        total_score = download_score + upload_score + latency_score + signal_score
-        
-        # Generate recommendation reason
-        reasons = []
-        if avg_download > 50:
-            reasons.append("excellent download speeds")
-        elif avg_download > 25:
-            reasons.append("good download speeds")
-        
-        if avg_latency < 50:
-            reasons.append("low latency")
-        elif avg_latency < 100:
-            reasons.append("moderate latency")
-        
-        if avg_signal > -70:
-            reasons.append("strong signal coverage")
-        elif avg_signal > -85:
-            reasons.append("decent signal coverage")
+        avg_download = float(row.avg_download) if row.avg_download is not None else 0
+        avg_upload = float(row.avg_upload) if row.avg_upload is not None else 0
+        avg_latency = float(row.avg_latency) if row.avg_latency is not None else 999
+        avg_signal = float(row.avg_signal) if row.avg_signal is not None else -100
         
-        recommendation_reason = f"Recommended for {', '.join(reasons) if reasons else 'basic connectivity'}"
-        
-        recommendations.append({
-            'carrier': carrier,
-            'score': round(total_score, 2),
-            'avg_download_speed': round(avg_download, 2),
-            'avg_upload_speed': round(avg_upload, 2),
-            'avg_latency': round(avg_latency, 2),
-            'avg_signal_strength': round(avg_signal, 2),
-            'total_samples': metrics['total_samples'],
-            'recommendation_reason': recommendation_reason
-        })
+        recommendations.append(
+            _score_carrier(row.carrier, row.total_samples, avg_download, avg_upload, avg_latency, avg_signal)
+        )
     
     # Sort by score (highest first)
     recommendations.sort(key=lambda x: x['score'], reverse=True)
     
     return recommendations
+
+def _score_carrier(carrier: str, total_samples: int, avg_download: float, avg_upload: float,
+                   avg_latency: float, avg_signal: float) -> dict:
+    # Calculate score (higher is better)
+    # Normalize metrics and combine them
+    download_score = min(avg_download / 100, 1.0) * 40  # Max 40 points
+    upload_score = min(avg_upload / 50, 1.0) * 20       # Max 20 points
+    latency_score = max(0, (200 - avg_latency) / 200) * 25  # Max 25 points (lower latency is better)
+    signal_score = max(0, (avg_signal + 120) / 70) * 15     # Max 15 points (higher signal is better)
+    
+    total_score = download_score + upload_score + latency_score + signal_score
+    
+    # Generate recommendation reason
+    reasons = []
+    if avg_download > 50:
+        reasons.append("excellent download speeds")
+    elif avg_download > 25:
+        reasons.append("good download speeds")
+    
+    if avg_latency < 50:
+        reasons.append("low latency")
+    elif avg_latency < 100:
+        reasons.append("moderate latency")
+    
+    if avg_signal > -70:
+        reasons.append("strong signal coverage")
+    elif avg_signal > -85:
+        reasons.append("decent signal coverage")
+    
+    recommendation_reason = f"Recommended for {', '.join(reasons) if reasons else 'basic connectivity'}"
+    
+    return {
+        'carrier': carrier,
+        'score': round(total_score, 2),
+        'avg_download_speed': round(avg_download, 2),
+        'avg_upload_speed': round(avg_upload, 2),
+        'avg_latency': round(avg_latency, 2),
+        'avg_signal_strength': round(avg_signal, 2),
+        'total_samples': total_samples,
+        'recommendation_reason': recommendation_reason
+    }
+
+# Admin analytics
+def select_provider_analytics(provider: str) -> Select:
+    logs = NetworkLog.__table__.c
+    feedback = Feedback.__table__.c
+    combined = union_all(
+        select(
+            logs.location, logs.latency, logs.jitter, logs.packet_loss, logs.signal_strength,
+            null().label("rating"), literal(0).label("is_feedback")
+        ).where(logs.carrier == provider),
+        select(
+            feedback.location, null(), null(), null(), null(),
+            feedback.overall_satisfaction, literal(1)
+        ).where(feedback.carrier == provider),
+    ).subquery()
+    return (
+        select(
+            combined.c.location,
+            func.avg(combined.c.latency).label("avg_latency"),
+            func.avg(combined.c.jitter).label("avg_jitter"),
+            func.avg(combined.c.packet_loss).label("avg_packet_loss"),
+            func.avg(combined.c.signal_strength).label("avg_signal_strength"),
+            func.avg(combined.c.rating).label("avg_user_rating"),
+            func.sum(combined.c.is_feedback).label("total_feedbacks"),
+        )
+        .group_by(combined.c.location)
+        .order_by(combined.c.location)
+    )
+
+def get_provider_analytics(db: Session, provider: str) -> List[dict]:
+    """Per-location network and feedback averages for one carrier, in one query.
+
+    Both tables are scanned once through their (carrier, location) indexes
+    and combined with UNION ALL before a single GROUP BY, so locations with
+    only logs or only feedback still show up (no FULL OUTER JOIN needed).
+    """
+    return [
+        {
+            "location": row.location,
+            "avg_latency": _rounded(row.avg_latency),
+            "avg_jitter": _rounded(row.avg_jitter),
+            "avg_packet_loss": _rounded(row.avg_packet_loss),
+            "avg_signal_strength": _rounded(row.avg_signal_strength),
+            "avg_user_rating": _rounded(row.avg_user_rating),
+            "total_feedbacks": int(row.total_feedbacks or 0),
+        }
+        for row in db.execute(select_provider_analytics(provider))
+    ]
+
+def _rounded(value) -> float:
+    return round(float(value), 2) if value is not None else 0.0
+
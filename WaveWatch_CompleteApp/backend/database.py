@@ -2,7 +2,11 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import threading
+import time
+from datetime import datetime
 from dotenv import load_dotenv
+from sqlite_local import SQLITE_SINGLE_WRITER, SQLiteWriter, configure_sqlite, is_file_database
 
 # Load environment variables
 load_dotenv()
@@ -59,6 +63,15 @@ if engine is None:
     # Create a dummy engine for development
     engine = create_engine("sqlite:///./fallback.db")
 
+sqlite_writer = None
+if engine.dialect.name == "sqlite":
+    # Embedded mode: WAL and tuned pragmas, ingest writes through one queued writer
+    engine.dispose()  # Connections opened by the connection test predate the pragmas
+    configure_sqlite(engine)
+    if SQLITE_SINGLE_WRITER and is_file_database(engine):
+        sqlite_writer = SQLiteWriter(engine.url)
+    print(f"🪶 SQLite embedded mode: {engine.url.database} (single writer: {'✅' if sqlite_writer else '❌'})")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -69,6 +82,93 @@ def get_db():
     finally:
         db.close()
 
+# Optional read-only replica for heavy reads (lists, analytics, exports).
+# Ingest and auth always use the primary; reads fall back to the primary
+# while the replica is unreachable or lags more than MAX_REPLICA_LAG_SECONDS.
+READ_REPLICA_URL = os.getenv("READ_REPLICA_URL")
+MAX_REPLICA_LAG_SECONDS = float(os.getenv("MAX_REPLICA_LAG_SECONDS", "10"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "5"))
+
+replica_engine = None
+ReplicaSessionLocal = None
+if READ_REPLICA_URL:
+    replica_engine = create_engine(
+        READ_REPLICA_URL,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=2,
+        max_overflow=5,
+        echo=False,
+        connect_args={"connect_timeout": 10} if READ_REPLICA_URL.startswith("postgresql") else {}
+    )
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    print(f"📖 Read replica configured: {READ_REPLICA_URL[:70]}...")
+
+replica_state = {
+    "configured": replica_engine is not None,
+    "healthy": None,
+    "lag_seconds": None,
+    "checked_at": None,
+    "error": None,
+    "reads": {"replica": 0, "primary": 0}
+}
+_replica_checked = 0.0
+_replica_check_lock = threading.Lock()
+
+def _replica_lag(conn) -> float:
+    if conn.dialect.name != "postgresql":
+        return 0.0  # e.g. a second SQLite file used for local testing
+    # An idle primary sends no WAL, so "replayed everything received" counts as no lag
+    lag = conn.execute(text(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+        "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )).scalar()
+    return float(lag or 0)
+
+def check_replica():
+    """Refresh the cached replica health and lag"""
+    global _replica_checked
+    try:
+        with replica_engine.connect() as conn:
+            lag = _replica_lag(conn)
+        replica_state.update(healthy=True, lag_seconds=round(lag, 3), error=None)
+    except Exception as e:
+        replica_state.update(healthy=False, lag_seconds=None, error=str(e))
+    replica_state["checked_at"] = datetime.utcnow().isoformat()
+    _replica_checked = time.monotonic()
+
+def use_replica() -> bool:
+    """Whether reads should go to the replica right now.
+
+    The lag is re-checked at most every REPLICA_LAG_CHECK_SECONDS, by one
+    thread; concurrent callers use the previous result meanwhile.
+    """
+    if replica_engine is None:
+        return False
+    if time.monotonic() - _replica_checked > REPLICA_LAG_CHECK_SECONDS:
+        if _replica_check_lock.acquire(blocking=replica_state["healthy"] is None):
+            try:
+                check_replica()
+            finally:
+                _replica_check_lock.release()
+    return bool(replica_state["healthy"]) and replica_state["lag_seconds"] <= MAX_REPLICA_LAG_SECONDS
+
+def ReadSessionLocal():
+    """Session for read-only work: the replica when usable, else the primary"""
+    if use_replica():
+        replica_state["reads"]["replica"] += 1
+        return ReplicaSessionLocal()
+    replica_state["reads"]["primary"] += 1
+    return SessionLocal()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def test_connection():
     """Test the database connection"""
     if engine is None:
@@ -1,205 +1,827 @@
-"""
-Database Manager for handling table creation, migrations, and schema updates safely
-"""
-from sqlalchemy import create_engine, text, inspect, MetaData
-from sqlalchemy.exc import SQLAlchemyError
-from database import engine, Base
-import models
-import logging
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-class DatabaseManager:
-    def __init__(self):
-        self.engine = engine
-        self.inspector = inspect(self.engine)
-        
-    def table_exists(self, table_name: str) -> bool:
-        """Check if a table exists in the database"""
-        try:
-            return table_name in self.inspector.get_table_names()
-        except Exception as e:
-            logger.error(f"Error checking if table {table_name} exists: {e}")
-            return False
-    
-    def get_existing_tables(self) -> list:
-        """Get list of all existing tables"""
-        try:
-            return self.inspector.get_table_names()
-        except Exception as e:
-            logger.error(f"Error getting existing tables: {e}")
-            return []
-    
-    def get_table_columns(self, table_name: str) -> list:
-        """Get columns for a specific table"""
-        try:
-            if self.table_exists(table_name):
-                columns = self.inspector.get_columns(table_name)
-                return [col['name'] for col in columns]
-            return []
-        except Exception as e:
-            logger.error(f"Error getting columns for table {table_name}: {e}")
-            return []
-    
-    def create_missing_tables(self):
-        """Create only tables that don't exist"""
-        try:
-            logger.info("🔍 Checking for missing tables...")
-            
-            # Get all table names that should exist (from models)
-            expected_tables = []
-            for table in Base.metadata.tables.values():
-                expected_tables.append(table.name)
-            
-            existing_tables = self.get_existing_tables()
-            missing_tables = [table for table in expected_tables if table not in existing_tables]
-            
-            if missing_tables:
-                logger.info(f"📋 Creating missing tables: {missing_tables}")
-                
-                # Create only missing tables
-                for table_name in missing_tables:
-                    table = Base.metadata.tables[table_name]
-                    table.create(self.engine, checkfirst=True)
-                    logger.info(f"✅ Created table: {table_name}")
-                
-                logger.info("🎉 All missing tables created successfully!")
-            else:
-                logger.info("✅ All tables already exist, no action needed")
-                
-        except Exception as e:
-            logger.error(f"❌ Error creating missing tables: {e}")
-            raise
-    
-    def verify_table_schema(self, table_name: str) -> dict:
-        """Verify if table schema matches the model definition"""
-        try:
-            if not self.table_exists(table_name):
-                return {"exists": False, "schema_match": False, "missing_columns": []}
-            
-            existing_columns = self.get_table_columns(table_name)
-            
-            # Get expected columns from model
-            if table_name in Base.metadata.tables:
-                model_table = Base.metadata.tables[table_name]
-                expected_columns = [col.name for col in model_table.columns]
-                
-                missing_columns = [col for col in expected_columns if col not in existing_columns]
-                extra_columns = [col for col in existing_columns if col not in expected_columns]
-                
-                return {
-                    "exists": True,
-                    "schema_match": len(missing_columns) == 0 and len(extra_columns) == 0,
-                    "missing_columns": missing_columns,
-                    "extra_columns": extra_columns,
-                    "existing_columns": existing_columns,
-                    "expected_columns": expected_columns
-                }
-            
-            return {"exists": True, "schema_match": False, "error": "Model not found"}
-            
-        except Exception as e:
-            logger.error(f"Error verifying schema for table {table_name}: {e}")
-            return {"exists": False, "schema_match": False, "error": str(e)}
-    
-    def add_missing_columns(self, table_name: str):
-        """Add missing columns to existing table"""
-        try:
-            schema_info = self.verify_table_schema(table_name)
-            
-            if schema_info.get("missing_columns"):
-                logger.info(f"🔧 Adding missing columns to {table_name}: {schema_info['missing_columns']}")
-                
-                # This is a simplified approach - in production, use Alembic for complex migrations
-                model_table = Base.metadata.tables[table_name]
-                
-                for column_name in schema_info["missing_columns"]:
-                    column = model_table.columns[column_name]
-                    column_type = column.type.compile(self.engine.dialect)
-                    
-                    # Build ALTER TABLE statement
-                    alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"
-                    
-                    # Add default value if column is not nullable
-                    if not column.nullable and column.default is None:
-                        if 'VARCHAR' in str(column_type) or 'TEXT' in str(column_type):
-                            alter_sql += " DEFAULT ''"
-                        elif 'INTEGER' in str(column_type) or 'NUMERIC' in str(column_type):
-                            alter_sql += " DEFAULT 0"
-                        elif 'BOOLEAN' in str(column_type):
-                            alter_sql += " DEFAULT FALSE"
-                        elif 'TIMESTAMP' in str(column_type):
-                            alter_sql += " DEFAULT CURRENT_TIMESTAMP"
-                    
-                    with self.engine.connect() as conn:
-                        conn.execute(text(alter_sql))
-                        conn.commit()
-                        logger.info(f"✅ Added column {column_name} to {table_name}")
-                
-        except Exception as e:
-            logger.error(f"❌ Error adding missing columns to {table_name}: {e}")
-            raise
-    
-    def safe_initialize_database(self):
-        """Safely initialize database with existing table checks"""
-        try:
-            logger.info("🚀 Starting safe database initialization...")
-            
-            # Test connection first
-            with self.engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
-                logger.info("✅ Database connection successful")
-            
-            # Get current state
-            existing_tables = self.get_existing_tables()
-            logger.info(f"📊 Found existing tables: {existing_tables}")
-            
-            # Create missing tables only
-            self.create_missing_tables()
-            
-            # Verify and update schema for existing tables
-            for table_name in existing_tables:
-                if table_name in Base.metadata.tables:
-                    schema_info = self.verify_table_schema(table_name)
-                    logger.info(f"🔍 Schema check for {table_name}: {schema_info}")
-                    
-                    if not schema_info.get("schema_match") and schema_info.get("missing_columns"):
-                        logger.info(f"🔧 Updating schema for {table_name}")
-                        self.add_missing_columns(table_name)
-            
-            logger.info("🎉 Database initialization completed successfully!")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Database initialization failed: {e}")
-            return False
-    
-    def get_database_info(self) -> dict:
-        """Get comprehensive database information"""
-        try:
-            info = {
-                "connection_status": "connected",
-                "existing_tables": self.get_existing_tables(),
-                "table_details": {}
-            }
-            
-            for table_name in info["existing_tables"]:
-                info["table_details"][table_name] = {
-                    "columns": self.get_table_columns(table_name),
-                    "schema_info": self.verify_table_schema(table_name)
-                }
-            
-            return info
-            
-        except Exception as e:
-            return {
-                "connection_status": "failed",
-                "error": str(e),
-                "existing_tables": [],
-                "table_details": {}
-            }
-
-# Global database manager instance
-db_manager = DatabaseManager()
+"""
+Database Manager for handling table creation, migrations, and schema updates safely
+"""
+from sqlalchemy import create_engine, text, inspect, MetaData, Integer
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from datetime import date, datetime, timedelta, timezone
+from database import engine, Base
+from dimensions import DictionaryEncoded
+import models
+import hashlib
+import json
+import logging
+import os
+import re
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Monthly range partitioning of large time-series tables (PostgreSQL only).
+# Table name -> partition key column.
+PARTITIONED_TABLES = {"network_logs": "timestamp"}
+PARTITIONING_ENABLED = os.getenv("NETWORK_LOGS_PARTITIONING", "true").lower() == "true"
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# Skip reconciliation at startup when the stored schema fingerprint matches the models
+SCHEMA_STATE_NAME = "models"
+SCHEMA_RECONCILE_ON_STARTUP = os.getenv("SCHEMA_RECONCILE_ON_STARTUP", "true").lower() == "true"
+
+# Hot queries and the declared indexes (any of) expected to serve them; see validate_query_plans
+KEY_QUERIES = {
+    "network_logs_by_carrier": ("ix_network_logs_carrier_timestamp",),
+    "feedback_by_carrier": ("ix_feedback_carrier_timestamp",),
+    # Any carrier-led index turns both halves of the UNION into index searches
+    "provider_analytics": ("ix_network_logs_carrier_location", "ix_feedback_carrier_location",
+                           "ix_network_logs_carrier_timestamp", "ix_feedback_carrier_timestamp"),
+    "expired_network_logs": ("ix_network_logs_timestamp_brin", "ix_network_logs_timestamp"),
+}
+
+def _month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def _next_month(month: date) -> date:
+    return date(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+def _key_query_statements() -> dict:
+    """The statements behind KEY_QUERIES, built by the same crud helpers the API uses"""
+    from sqlalchemy import select
+    from crud import select_feedbacks, select_network_logs, select_provider_analytics
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    logs = models.NetworkLog.__table__.c
+    return {
+        "network_logs_by_carrier": select_network_logs(carrier="MTN", since=since).limit(100),
+        "feedback_by_carrier": select_feedbacks(carrier="MTN", since=since).limit(100),
+        "provider_analytics": select_provider_analytics("MTN"),
+        "expired_network_logs": select(logs.id).where(logs.timestamp < since - timedelta(days=365)).limit(1000),
+    }
+
+class DatabaseManager:
+    def __init__(self):
+        self.engine = engine
+        # Reflected schema shared by every check; see schema_snapshot()
+        self._snapshot = None
+    
+    @property
+    def supports_partitioning(self) -> bool:
+        return PARTITIONING_ENABLED and self.engine.dialect.name == "postgresql"
+    
+    # Schema snapshot
+    
+    def schema_snapshot(self, refresh: bool = False) -> dict:
+        """Tables, columns, indexes and partitioning, reflected in one pass.
+        
+        Columns and indexes of all tables come from one catalog query each
+        (SQLAlchemy's multi-table reflection), instead of several round trips
+        per table. Cached until refreshed or invalidated by DDL.
+        """
+        if self._snapshot is None or refresh:
+            with self.engine.connect() as conn:
+                self._snapshot = self._reflect(conn)
+        return self._snapshot
+    
+    def invalidate_snapshot(self):
+        self._snapshot = None
+    
+    def _reflect(self, conn) -> dict:
+        inspector = inspect(conn)
+        tables = {
+            name: {"columns": [], "column_types": {}, "indexes": [], "index_columns": {}}
+            for name in inspector.get_table_names()
+        }
+        if tables:
+            for (_, table_name), columns in inspector.get_multi_columns().items():
+                if table_name in tables:
+                    tables[table_name]["columns"] = [col["name"] for col in columns]
+                    tables[table_name]["column_types"] = {col["name"]: col["type"] for col in columns}
+            for (_, table_name), indexes in inspector.get_multi_indexes().items():
+                if table_name in tables:
+                    tables[table_name]["indexes"] = [index["name"] for index in indexes]
+                    tables[table_name]["index_columns"] = {
+                        index["name"]: index["column_names"] for index in indexes
+                    }
+        
+        partitioned, invalid_indexes = [], {}
+        if self.engine.dialect.name == "postgresql":
+            partitioned = conn.execute(text(
+                "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relnamespace = to_regnamespace(current_schema())"
+            )).scalars().all()
+            # Left behind by a failed or interrupted concurrent build
+            for table_name, index_name in conn.execute(text(
+                "SELECT t.relname, ic.relname FROM pg_index i "
+                "JOIN pg_class ic ON ic.oid = i.indexrelid JOIN pg_class t ON t.oid = i.indrelid "
+                "WHERE NOT i.indisvalid AND t.relnamespace = to_regnamespace(current_schema())"
+            )):
+                invalid_indexes.setdefault(table_name, []).append(index_name)
+        return {"tables": tables, "partitioned": list(partitioned), "invalid_indexes": invalid_indexes}
+    
+    def schema_fingerprint(self) -> str:
+        """Hash of the schema the models expect on this database.
+        
+        Covers tables, column names/types/nullability, the declared indexes
+        and whether partitioning is enabled, so any model change (or switching
+        partitioning on) changes the fingerprint.
+        """
+        dialect = self.engine.dialect
+        spec = {
+            "dialect": dialect.name,
+            "partitioned": sorted(PARTITIONED_TABLES) if self.supports_partitioning else [],
+            "tables": {
+                table.name: {
+                    "columns": [[col.name, col.type.compile(dialect), col.nullable] for col in table.columns],
+                    "indexes": sorted(
+                        [index.name, [col.name for col in index.columns], bool(index.unique),
+                         index.dialect_options["postgresql"]["using"]]
+                        for index in self.declared_indexes(table.name)
+                    ),
+                }
+                for table in Base.metadata.sorted_tables
+            },
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    
+    def stored_fingerprint(self, conn) -> str:
+        """Fingerprint recorded by the last complete reconciliation, if any"""
+        try:
+            return conn.execute(
+                text("SELECT fingerprint FROM schema_state WHERE name = :name"), {"name": SCHEMA_STATE_NAME}
+            ).scalar()
+        except SQLAlchemyError:
+            # First boot: schema_state does not exist yet
+            conn.rollback()
+            return None
+    
+    def store_fingerprint(self, fingerprint: str):
+        table = models.SchemaState.__table__
+        with self.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.name == SCHEMA_STATE_NAME))
+            conn.execute(table.insert().values(
+                name=SCHEMA_STATE_NAME, fingerprint=fingerprint, applied_at=datetime.now(timezone.utc)
+            ))
+    
+    def table_exists(self, table_name: str) -> bool:
+        """Check if a table exists in the database"""
+        try:
+            return table_name in self.schema_snapshot()["tables"]
+        except Exception as e:
+            logger.error(f"Error checking if table {table_name} exists: {e}")
+            return False
+    
+    def get_existing_tables(self) -> list:
+        """Get list of all existing tables"""
+        try:
+            return list(self.schema_snapshot()["tables"])
+        except Exception as e:
+            logger.error(f"Error getting existing tables: {e}")
+            return []
+    
+    def get_table_columns(self, table_name: str) -> list:
+        """Get columns for a specific table"""
+        try:
+            table = self.schema_snapshot()["tables"].get(table_name)
+            return list(table["columns"]) if table else []
+        except Exception as e:
+            logger.error(f"Error getting columns for table {table_name}: {e}")
+            return []
+    
+    def _create_table_ddl(self, table_name: str) -> list:
+        if table_name in PARTITIONED_TABLES and self.supports_partitioning:
+            return self._partitioned_table_ddl(table_name)
+        table = Base.metadata.tables[table_name]
+        statements = [str(CreateTable(table).compile(self.engine)).strip()]
+        statements += [str(CreateIndex(index).compile(self.engine)) for index in self.declared_indexes(table_name)]
+        return statements
+    
+    def _add_column_ddl(self, table_name: str, column) -> str:
+        column_type = column.type.compile(self.engine.dialect)
+        
+        # Build ALTER TABLE statement
+        alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}"
+        
+        # Add default value if column is not nullable
+        if not column.nullable and column.default is None:
+            if 'VARCHAR' in str(column_type) or 'TEXT' in str(column_type):
+                alter_sql += " DEFAULT ''"
+            elif 'INTEGER' in str(column_type) or 'NUMERIC' in str(column_type):
+                alter_sql += " DEFAULT 0"
+            elif 'BOOLEAN' in str(column_type):
+                alter_sql += " DEFAULT FALSE"
+            elif 'TIMESTAMP' in str(column_type):
+                alter_sql += " DEFAULT CURRENT_TIMESTAMP"
+        return alter_sql
+    
+    def schema_changes(self, snapshot: dict = None) -> list:
+        """DDL creating missing tables (with their indexes) and adding missing columns"""
+        snapshot = snapshot or self.schema_snapshot()
+        statements = []
+        # Dependency order, so foreign keys point at tables created earlier
+        for table in Base.metadata.sorted_tables:
+            existing = snapshot["tables"].get(table.name)
+            if existing is None:
+                statements += self._create_table_ddl(table.name)
+                continue
+            for column in table.columns:
+                if column.name not in existing["columns"]:
+                    statements.append(self._add_column_ddl(table.name, column))
+        return statements
+    
+    def apply_schema_changes(self, statements: list):
+        """Run DDL statements in one transaction (all or nothing on PostgreSQL)"""
+        if not statements:
+            return
+        try:
+            logger.info(f"🔧 Applying {len(statements)} schema changes in one transaction")
+            with self.engine.begin() as conn:
+                for statement in statements:
+                    logger.info(f"   {statement.splitlines()[0]}")
+                    conn.execute(text(statement))
+            logger.info("✅ Schema changes applied")
+        finally:
+            self.invalidate_snapshot()
+    
+    def pending_dictionary_columns(self, snapshot: dict = None) -> dict:
+        """Dictionary-encoded model columns still stored as strings, per table"""
+        snapshot = snapshot or self.schema_snapshot()
+        pending = {}
+        for table in Base.metadata.sorted_tables:
+            existing = snapshot["tables"].get(table.name)
+            if existing is None:
+                continue
+            for column in table.columns:
+                reflected = existing["column_types"].get(column.name)
+                if isinstance(column.type, DictionaryEncoded) and reflected is not None \
+                        and not isinstance(reflected, Integer):
+                    pending.setdefault(table.name, []).append(column)
+        return pending
+    
+    def encode_dictionary_columns(self) -> list:
+        """Convert string columns of existing tables to dimension ids (see dimensions.py).
+        
+        Rewrites each affected table in one transaction: distinct values go
+        into dimension_values, a new id column is filled from them, the string
+        column is dropped and the id column takes its name. Indexes on the
+        column are dropped first and rebuilt by create_missing_indexes().
+        """
+        snapshot = self.schema_snapshot(refresh=True)
+        pending = self.pending_dictionary_columns(snapshot)
+        dimension_table = models.DimensionValue.__tablename__
+        try:
+            for table_name, columns in pending.items():
+                names = {column.name for column in columns}
+                logger.info(f"🗜️ Dictionary-encoding {table_name}: {sorted(names)} (rewrites the table)")
+                with self.engine.begin() as conn:
+                    for index_name, index_columns in snapshot["tables"][table_name]["index_columns"].items():
+                        if names & set(index_columns):
+                            conn.execute(text(f"DROP INDEX {index_name}"))
+                    for column in columns:
+                        params = {"kind": column.type.kind}
+                        encoded = f"{column.name}__id"
+                        conn.execute(text(
+                            f"INSERT INTO {dimension_table} (kind, value) "
+                            f"SELECT DISTINCT CAST(:kind AS VARCHAR), {column.name} FROM {table_name} "
+                            f"WHERE {column.name} IS NOT NULL ON CONFLICT DO NOTHING"
+                        ), params)
+                        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {encoded} INTEGER"))
+                        conn.execute(text(
+                            f"UPDATE {table_name} SET {encoded} = (SELECT d.id FROM {dimension_table} d "
+                            f"WHERE d.kind = :kind AND d.value = {table_name}.{column.name})"
+                        ), params)
+                        conn.execute(text(f"ALTER TABLE {table_name} DROP COLUMN {column.name}"))
+                        conn.execute(text(f"ALTER TABLE {table_name} RENAME COLUMN {encoded} TO {column.name}"))
+                        # SQLite cannot add NOT NULL to an existing column; the models still enforce it
+                        if not column.nullable and self.engine.dialect.name == "postgresql":
+                            conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column.name} SET NOT NULL"))
+                logger.info(f"✅ {table_name} dictionary-encoded")
+        finally:
+            self.invalidate_snapshot()
+        return list(pending)
+    
+    def create_missing_tables(self):
+        """Create only tables that don't exist"""
+        try:
+            logger.info("🔍 Checking for missing tables...")
+            snapshot = self.schema_snapshot()
+            missing_tables = [table.name for table in Base.metadata.sorted_tables
+                              if table.name not in snapshot["tables"]]
+            
+            if missing_tables:
+                logger.info(f"📋 Creating missing tables: {missing_tables}")
+                statements = []
+                for table_name in missing_tables:
+                    statements += self._create_table_ddl(table_name)
+                self.apply_schema_changes(statements)
+                self.maintain_partitions()
+                logger.info("🎉 All missing tables created successfully!")
+            else:
+                logger.info("✅ All tables already exist, no action needed")
+                
+        except Exception as e:
+            logger.error(f"❌ Error creating missing tables: {e}")
+            raise
+    
+    def verify_table_schema(self, table_name: str) -> dict:
+        """Verify if table schema matches the model definition"""
+        try:
+            if not self.table_exists(table_name):
+                return {"exists": False, "schema_match": False, "missing_columns": []}
+            
+            existing_columns = self.get_table_columns(table_name)
+            
+            # Get expected columns from model
+            if table_name in Base.metadata.tables:
+                model_table = Base.metadata.tables[table_name]
+                expected_columns = [col.name for col in model_table.columns]
+                
+                missing_columns = [col for col in expected_columns if col not in existing_columns]
+                extra_columns = [col for col in existing_columns if col not in expected_columns]
+                
+                return {
+                    "exists": True,
+                    "schema_match": len(missing_columns) == 0 and len(extra_columns) == 0,
+                    "missing_columns": missing_columns,
+                    "extra_columns": extra_columns,
+                    "existing_columns": existing_columns,
+                    "expected_columns": expected_columns
+                }
+            
+            return {"exists": True, "schema_match": False, "error": "Model not found"}
+            
+        except Exception as e:
+            logger.error(f"Error verifying schema for table {table_name}: {e}")
+            return {"exists": False, "schema_match": False, "error": str(e)}
+    
+    def add_missing_columns(self, table_name: str):
+        """Add missing columns to existing table"""
+        try:
+            schema_info = self.verify_table_schema(table_name)
+            
+            if schema_info.get("missing_columns"):
+                logger.info(f"🔧 Adding missing columns to {table_name}: {schema_info['missing_columns']}")
+                
+                # This is a simplified approach - in production, use Alembic for complex migrations
+                model_table = Base.metadata.tables[table_name]
+                self.apply_schema_changes([
+                    self._add_column_ddl(table_name, model_table.columns[column_name])
+                    for column_name in schema_info["missing_columns"]
+                ])
+                
+        except Exception as e:
+            logger.error(f"❌ Error adding missing columns to {table_name}: {e}")
+            raise
+    
+    def declared_indexes(self, table_name: str) -> list:
+        """Model-declared indexes of a table that apply to this database's dialect"""
+        if table_name not in Base.metadata.tables:
+            return []
+        dialect = self.engine.dialect.name
+        return [
+            index for index in Base.metadata.tables[table_name].indexes
+            # Index.ddl_if(dialect=...) marks dialect-specific indexes (e.g. BRIN)
+            if index._ddl_if is None or index._ddl_if.dialect in (None, dialect)
+        ]
+    
+    def _index_sql(self, index, target: str, name: str = None, partition_key: str = None,
+                   concurrently: bool = False, only: bool = False) -> str:
+        """CREATE INDEX statement for a model index on `target` (PostgreSQL)"""
+        columns = [col.name for col in index.columns]
+        if index.unique and partition_key and partition_key not in columns:
+            # Unique indexes of partitioned tables must include the partition key
+            columns.append(partition_key)
+        using = index.dialect_options["postgresql"]["using"]
+        return (
+            f"CREATE {'UNIQUE ' if index.unique else ''}INDEX {'CONCURRENTLY ' if concurrently else ''}"
+            f"IF NOT EXISTS {name or index.name} ON {'ONLY ' if only else ''}{target}"
+            f"{f' USING {using}' if using else ''} ({', '.join(columns)})"
+        )
+    
+    def invalid_indexes(self, table_name: str) -> list:
+        """Indexes left invalid by a failed or interrupted concurrent build (PostgreSQL)"""
+        return list(self.schema_snapshot()["invalid_indexes"].get(table_name, []))
+    
+    def create_missing_indexes(self, table_name: str) -> list:
+        """Create model-declared indexes missing from an existing table.
+        
+        On PostgreSQL indexes are built CONCURRENTLY, so ingestion keeps
+        writing while a large table is indexed; an index left invalid by an
+        interrupted build is dropped and rebuilt. On a partitioned table the
+        parent index is created ON ONLY the parent, and each partition's index
+        is built concurrently and then attached.
+        """
+        try:
+            snapshot = self.schema_snapshot()
+            existing_indexes = set(snapshot["tables"].get(table_name, {}).get("indexes", []))
+            invalid = set(snapshot["invalid_indexes"].get(table_name, []))
+            created = []
+            
+            for index in self.declared_indexes(table_name):
+                if index.name in existing_indexes and index.name not in invalid:
+                    continue
+                logger.info(f"🔧 Creating missing index {index.name} on {table_name}")
+                if self.engine.dialect.name != "postgresql":
+                    index.create(self.engine, checkfirst=True)
+                elif table_name in snapshot["partitioned"]:
+                    self._create_partitioned_index(table_name, index)
+                else:
+                    # CONCURRENTLY cannot run inside a transaction block
+                    with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        if index.name in invalid:
+                            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+                        conn.execute(text(self._index_sql(index, table_name, concurrently=True)))
+                created.append(index.name)
+                logger.info(f"✅ Created index {index.name}")
+            if created:
+                self.invalidate_snapshot()
+            return created
+                    
+        except Exception as e:
+            logger.error(f"❌ Error creating missing indexes on {table_name}: {e}")
+            raise
+    
+    def _create_partitioned_index(self, table_name: str, index):
+        key = PARTITIONED_TABLES[table_name]
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # Stays invalid until every partition's index is attached
+            conn.execute(text(self._index_sql(index, table_name, partition_key=key, only=True)))
+            for partition in self.child_tables(table_name):
+                child_index = f"{index.name}_{partition[len(table_name) + 1:]}"[:63]
+                conn.execute(text(self._index_sql(
+                    index, partition, name=child_index, partition_key=key, concurrently=True
+                )))
+                conn.execute(text(f"ALTER INDEX {index.name} ATTACH PARTITION {child_index}"))
+    
+    # Index verification
+    
+    def index_usage(self) -> dict:
+        """Scan counts and sizes of indexes since the last statistics reset (PostgreSQL).
+        
+        Partition indexes are reported under their parent table and index.
+        """
+        if self.engine.dialect.name != "postgresql":
+            return {}
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT COALESCE(pt.relname, s.relname) AS table_name, "
+                "COALESCE(pi.relname, s.indexrelname) AS index_name, "
+                "s.idx_scan, pg_relation_size(s.indexrelid) AS size_bytes, "
+                "i.indisunique OR i.indisprimary AS enforces_constraint "
+                "FROM pg_stat_user_indexes s JOIN pg_index i ON i.indexrelid = s.indexrelid "
+                "LEFT JOIN pg_inherits ti ON ti.inhrelid = s.relid LEFT JOIN pg_class pt ON pt.oid = ti.inhparent "
+                "LEFT JOIN pg_inherits ii ON ii.inhrelid = s.indexrelid LEFT JOIN pg_class pi ON pi.oid = ii.inhparent "
+                "WHERE s.schemaname = current_schema()"
+            )).mappings().all()
+        usage = {}
+        for row in rows:
+            entry = usage.setdefault(row["table_name"], {}).setdefault(
+                row["index_name"], {"scans": 0, "size_bytes": 0, "enforces_constraint": row["enforces_constraint"]}
+            )
+            entry["scans"] += row["idx_scan"] or 0
+            entry["size_bytes"] += row["size_bytes"] or 0
+        return usage
+    
+    def index_report(self) -> dict:
+        """Per table: declared indexes that are missing or invalid, indexes not
+        declared by the models, and indexes never scanned (PostgreSQL only)"""
+        snapshot = self.schema_snapshot(refresh=True)
+        usage = self.index_usage()
+        report = {}
+        for table_name in Base.metadata.tables:
+            if table_name not in snapshot["tables"]:
+                continue
+            declared = [index.name for index in self.declared_indexes(table_name)]
+            existing = snapshot["tables"][table_name]["indexes"]
+            table_usage = usage.get(table_name, {})
+            report[table_name] = {
+                "declared": declared,
+                "missing": [name for name in declared if name not in existing],
+                "invalid": self.invalid_indexes(table_name),
+                "undeclared": [name for name in existing if name not in declared],
+                # Unique/primary indexes enforce constraints even when never scanned
+                "unused": sorted(
+                    name for name, stats in table_usage.items()
+                    if stats["scans"] == 0 and not stats["enforces_constraint"]
+                ) if usage else None,
+                "usage": table_usage,
+            }
+        return report
+    
+    def _explain(self, conn, stmt) -> tuple:
+        """(indexes used, plan) of a statement, without executing it"""
+        dialect = self.engine.dialect
+        compiled = stmt.compile(dialect=dialect)
+        # Bound as the driver would see them (e.g. dictionary-encoded strings as ids)
+        params = {}
+        for name, value in compiled.params.items():
+            processor = compiled.binds[name].type.dialect_impl(dialect).bind_processor(dialect)
+            params[name] = processor(value) if processor else value
+        if compiled.positional:
+            params = tuple(params[name] for name in compiled.positiontup)
+        if self.engine.dialect.name == "postgresql":
+            plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled.string}", params).scalar()
+            indexes = []
+            nodes = [plan[0]["Plan"]]
+            while nodes:
+                node = nodes.pop()
+                if "Index Name" in node:
+                    indexes.append(node["Index Name"])
+                nodes.extend(node.get("Plans", []))
+            return indexes, plan
+        plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled.string}", params)]
+        indexes = []
+        for detail in plan:
+            match = re.search(r"USING (?:COVERING )?INDEX (\w+)", detail)
+            if match:
+                indexes.append(match.group(1))
+        return indexes, plan
+    
+    def validate_query_plans(self) -> dict:
+        """EXPLAIN each key query and check that an expected index serves it.
+        
+        On PostgreSQL sequential scans are disabled for the check: on a small
+        or fresh table the planner rightly prefers a seq scan, but the question
+        here is whether the declared index can serve the query at all.
+        """
+        results = {}
+        with self.engine.connect() as conn:
+            if self.engine.dialect.name == "postgresql":
+                conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for name, stmt in _key_query_statements().items():
+                expected = KEY_QUERIES[name]
+                try:
+                    used, plan = self._explain(conn, stmt)
+                except SQLAlchemyError as e:
+                    results[name] = {"ok": False, "expected": list(expected), "error": str(e)}
+                    continue
+                # Partition indexes are named after the parent index
+                ok = any(index.startswith(expected_name) for index in used for expected_name in expected)
+                results[name] = {"ok": ok, "expected": list(expected), "used": used}
+                if not ok:
+                    results[name]["plan"] = plan
+            conn.rollback()
+        return results
+    
+    def safe_initialize_database(self, force: bool = False):
+        """Safely initialize database with existing table checks.
+        
+        A boot whose models match the fingerprint stored by the last complete
+        run only reads that fingerprint (and keeps partitions ahead). Otherwise
+        the schema is reflected once, missing tables and columns are added in
+        a single transaction, and missing indexes are built afterwards
+        (concurrently on PostgreSQL, which cannot run inside a transaction).
+        """
+        try:
+            logger.info("🚀 Starting safe database initialization...")
+            fingerprint = self.schema_fingerprint()
+            
+            # Connection test and fingerprint check in one round trip
+            with self.engine.connect() as conn:
+                stored = self.stored_fingerprint(conn)
+                logger.info("✅ Database connection successful")
+            
+            if stored == fingerprint and not force:
+                logger.info("⚡ Schema unchanged since last initialization, skipping reconciliation")
+                self.maintain_partitions()
+                return True
+            
+            # Get current state
+            snapshot = self.schema_snapshot(refresh=True)
+            logger.info(f"📊 Found existing tables: {list(snapshot['tables'])}")
+            
+            # Missing tables and columns, all or nothing
+            self.apply_schema_changes(self.schema_changes(snapshot))
+            self.encode_dictionary_columns()
+            self.maintain_partitions()
+            
+            for table_name in Base.metadata.tables:
+                self.create_missing_indexes(table_name)
+            
+            complete = True
+            for table_name, info in self.index_report().items():
+                if info["missing"] or info["invalid"]:
+                    complete = False
+                    logger.warning(f"⚠️ Indexes on {table_name} missing: {info['missing']}, invalid: {info['invalid']}")
+                if info["unused"]:
+                    logger.info(f"ℹ️ Never-scanned indexes on {table_name}: {info['unused']}")
+            for name, result in self.validate_query_plans().items():
+                if not result["ok"]:
+                    logger.warning(f"⚠️ Query {name} is not served by any of {result['expected']}: {result}")
+            
+            # Only a fully reconciled schema lets later boots skip the checks
+            if complete:
+                self.store_fingerprint(fingerprint)
+            
+            logger.info("🎉 Database initialization completed successfully!")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Database initialization failed: {e}")
+            return False
+    
+    # Partition management
+    
+    def is_partitioned(self, table_name: str) -> bool:
+        """Check if a table is a PostgreSQL partitioned (parent) table"""
+        if self.engine.dialect.name != "postgresql":
+            return False
+        with self.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :name AND c.relnamespace = to_regnamespace(current_schema())"
+            ), {"name": table_name}).first() is not None
+    
+    def _partitioned_table_ddl(self, table_name: str, target_name: str = None) -> list:
+        """DDL for a range-partitioned copy of a model table.
+        
+        PostgreSQL requires the partition key in every primary key and unique
+        index, so the key becomes (id, <key>) and unique indexes get the key
+        column appended. The ORM keeps mapping id as the identity.
+        """
+        table = Base.metadata.tables[table_name]
+        key = PARTITIONED_TABLES[table_name]
+        target_name = target_name or table_name
+        
+        create_sql = str(CreateTable(table).compile(self.engine)).strip()
+        create_sql = create_sql.replace(f"CREATE TABLE {table_name} ", f"CREATE TABLE {target_name} ", 1)
+        create_sql = create_sql.replace("PRIMARY KEY (id)", f"PRIMARY KEY (id, {key})")
+        statements = [f"{create_sql} PARTITION BY RANGE ({key})"]
+        
+        for index in self.declared_indexes(table_name):
+            statements.append(self._index_sql(index, target_name, partition_key=key))
+        # Catches rows outside the pre-created monthly ranges (e.g. device clock errors)
+        statements.append(f"CREATE TABLE IF NOT EXISTS {target_name}_default PARTITION OF {target_name} DEFAULT")
+        return statements
+    
+    def create_partitioned_table(self, table_name: str):
+        """Create a model table as a monthly range-partitioned table"""
+        try:
+            logger.info(f"🧩 Creating {table_name} partitioned by month on {PARTITIONED_TABLES[table_name]}")
+            with self.engine.begin() as conn:
+                for statement in self._partitioned_table_ddl(table_name):
+                    conn.execute(text(statement))
+            self.ensure_partitions(table_name)
+        except Exception as e:
+            logger.error(f"❌ Error creating partitioned table {table_name}: {e}")
+            raise
+    
+    def partition_name(self, table_name: str, month: date) -> str:
+        return f"{table_name}_y{month.year:04d}m{month.month:02d}"
+    
+    def child_tables(self, table_name: str) -> list:
+        """All partitions of a table, including the default partition"""
+        with self.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :name AND c.relkind IN ('r', 'p')"
+            ), {"name": table_name}).scalars().all()
+    
+    def list_partitions(self, table_name: str) -> list:
+        """Monthly partitions of a table as (name, month start), oldest first"""
+        names = self.child_tables(table_name)
+        pattern = re.compile(rf"^{re.escape(table_name)}_y(\d{{4}})m(\d{{2}})$")
+        partitions = []
+        for name in names:
+            match = pattern.match(name)
+            if match:
+                partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+        return sorted(partitions, key=lambda item: item[1])
+    
+    def ensure_partitions(self, table_name: str, since: date = None,
+                          months_ahead: int = PARTITION_MONTHS_AHEAD) -> list:
+        """Pre-create monthly partitions from `since` (default: this month) to months_ahead"""
+        today = datetime.now(timezone.utc).date()
+        month = _month_start(since or today)
+        last = _month_start(today)
+        for _ in range(months_ahead):
+            last = _next_month(last)
+        
+        # One catalog query for all partitions, not one per month
+        existing = set(self.child_tables(table_name))
+        missing = []
+        while month <= last:
+            if self.partition_name(table_name, month) not in existing:
+                missing.append(month)
+            month = _next_month(month)
+        if not missing:
+            return []
+        
+        created = []
+        with self.engine.begin() as conn:
+            for month in missing:
+                name = self.partition_name(table_name, month)
+                conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {table_name} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+                ))
+                created.append(name)
+        self.invalidate_snapshot()
+        logger.info(f"✅ Created partitions: {created}")
+        return created
+    
+    def drop_expired_partitions(self, table_name: str, retention: timedelta, safe_through_id: int = None) -> list:
+        """Detach and drop monthly partitions entirely older than the retention.
+        
+        This replaces a large DELETE with a metadata operation. Partitions
+        holding ids above safe_through_id (e.g. not rolled up yet) are kept.
+        """
+        cutoff = (datetime.now(timezone.utc) - retention).date()
+        dropped = []
+        for name, month in self.list_partitions(table_name):
+            if _next_month(month) > cutoff:
+                break
+            with self.engine.begin() as conn:
+                if safe_through_id is not None:
+                    max_id = conn.execute(text(f"SELECT max(id) FROM {name}")).scalar()
+                    if max_id is not None and max_id > safe_through_id:
+                        logger.info(f"⏳ Keeping {name}: rows above id {safe_through_id} not processed yet")
+                        break
+                conn.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+            logger.info(f"🧹 Dropped expired partition {name}")
+        return dropped
+    
+    def maintain_partitions(self) -> dict:
+        """Pre-create upcoming partitions for every partitioned table"""
+        created = {}
+        if not self.supports_partitioning:
+            return created
+        for table_name in PARTITIONED_TABLES:
+            try:
+                if self.is_partitioned(table_name):
+                    created[table_name] = self.ensure_partitions(table_name)
+                else:
+                    logger.info(f"ℹ️ {table_name} is not partitioned; run setup_database.py --partition to migrate it")
+            except Exception as e:
+                logger.error(f"❌ Error maintaining partitions of {table_name}: {e}")
+        return created
+    
+    def migrate_to_partitioned(self, table_name: str):
+        """Convert an existing plain table into a partitioned one (copies all rows).
+        
+        Runs in one transaction: the old table is renamed to <table>_unpartitioned
+        and kept, so it can be dropped once the migration is verified.
+        """
+        if not self.supports_partitioning or self.is_partitioned(table_name):
+            return
+        key = PARTITIONED_TABLES[table_name]
+        legacy = f"{table_name}_unpartitioned"
+        logger.info(f"🔄 Migrating {table_name} to monthly partitions")
+        with self.engine.begin() as conn:
+            oldest = conn.execute(text(f"SELECT min({key}) FROM {table_name}")).scalar()
+            conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {legacy}"))
+            # Index names are schema-wide; free them for the new table
+            conn.execute(text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table_name}_pkey TO {legacy}_pkey"))
+            for index_name in self.schema_snapshot(refresh=True)["tables"][table_name]["indexes"]:
+                conn.execute(text(f"ALTER INDEX {index_name} RENAME TO {index_name}_unpartitioned"))
+            for statement in self._partitioned_table_ddl(table_name):
+                conn.execute(text(statement))
+            columns = ", ".join(col.name for col in Base.metadata.tables[table_name].columns)
+            month = _month_start(oldest.date() if oldest else datetime.now(timezone.utc).date())
+            last = _month_start(datetime.now(timezone.utc).date())
+            for _ in range(PARTITION_MONTHS_AHEAD):
+                last = _next_month(last)
+            while month <= last:
+                conn.execute(text(
+                    f"CREATE TABLE {self.partition_name(table_name, month)} PARTITION OF {table_name} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+                ))
+                month = _next_month(month)
+            conn.execute(text(f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {legacy}"))
+            # Continue ids after the copied rows
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+                f"(SELECT COALESCE(max(id), 0) + 1 FROM {legacy}), false)"
+            ))
+        self.invalidate_snapshot()
+        logger.info(f"✅ {table_name} is now partitioned; old rows kept in {legacy}")
+    
+    def get_database_info(self) -> dict:
+        """Get comprehensive database information"""
+        try:
+            self.schema_snapshot(refresh=True)
+            info = {
+                "connection_status": "connected",
+                "existing_tables": self.get_existing_tables(),
+                "table_details": {}
+            }
+            
+            for table_name in info["existing_tables"]:
+                info["table_details"][table_name] = {
+                    "columns": self.get_table_columns(table_name),
+                    "schema_info": self.verify_table_schema(table_name)
+                }
+            
+            return info
+            
+        except Exception as e:
+            return {
+                "connection_status": "failed",
+                "error": str(e),
+                "existing_tables": [],
+                "table_details": {}
+            }
+
+# Global database manager instance
+db_manager = DatabaseManager()
@@ -0,0 +1,108 @@
+"""
+In-memory pre-filter for idempotent ingestion.
+
+Records uploaded by the mobile app carry an idempotency key made of the
+device id and the row id in the device's local database. The unique index on
+(device_id, local_id) is the source of truth; this module only avoids extra
+queries:
+
+* an LRU map of recently stored keys -> row id acknowledges retries
+  without touching the database, and
+* a Bloom filter of every key seen by this process tells us when a key is
+  definitely new, so the common no-duplicate case is a plain insert.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+IdempotencyKey = Tuple[str, str]
+
+DEDUP_LRU_SIZE = int(os.getenv("DEDUP_LRU_SIZE", "100000"))
+DEDUP_BLOOM_BITS = int(os.getenv("DEDUP_BLOOM_BITS", str(8 * 1024 * 1024)))  # 1 MB
+DEDUP_BLOOM_HASHES = int(os.getenv("DEDUP_BLOOM_HASHES", "7"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys (no false negatives)"""
+
+    def __init__(self, num_bits: int, num_hashes: int):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        # Kirsch-Mitzenmacher double hashing
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class IdempotencyIndex:
+    """Thread-safe LRU + Bloom pre-filter for (device_id, local_id) keys"""
+
+    def __init__(self, lru_size: int = DEDUP_LRU_SIZE, bloom_bits: int = DEDUP_BLOOM_BITS,
+                 bloom_hashes: int = DEDUP_BLOOM_HASHES):
+        self.lru_size = lru_size
+        self._recent = OrderedDict()
+        self._bloom = BloomFilter(bloom_bits, bloom_hashes)
+        self._lock = threading.Lock()
+        self.stats = {"lru_hits": 0, "bloom_negatives": 0, "bloom_positives": 0}
+
+    @staticmethod
+    def _flat(key: IdempotencyKey) -> str:
+        return f"{key[0]}\x1f{key[1]}"
+
+    def known_id(self, key: IdempotencyKey) -> Optional[int]:
+        """Row id of a recently stored key, or None"""
+        flat = self._flat(key)
+        with self._lock:
+            row_id = self._recent.get(flat)
+            if row_id is not None:
+                self._recent.move_to_end(flat)
+                self.stats["lru_hits"] += 1
+            return row_id
+
+    def maybe_seen(self, key: IdempotencyKey) -> bool:
+        """False means the key was definitely never stored by this process.
+
+        Keys stored before a restart are unknown here; those are caught by
+        the unique index (ON CONFLICT DO NOTHING) on insert instead.
+        """
+        flat = self._flat(key)
+        with self._lock:
+            seen = flat in self._bloom
+            self.stats["bloom_positives" if seen else "bloom_negatives"] += 1
+            return seen
+
+    def remember(self, key: IdempotencyKey, row_id: int):
+        flat = self._flat(key)
+        with self._lock:
+            self._bloom.add(flat)
+            self._recent[flat] = row_id
+            self._recent.move_to_end(flat)
+            while len(self._recent) > self.lru_size:
+                self._recent.popitem(last=False)
+
+    def forget_recent(self):
+        """Drop the LRU, e.g. after a commit that remembered ids failed.
+
+        The Bloom filter is kept: a false positive only costs a lookup.
+        """
+        with self._lock:
+            self._recent.clear()
+
+
+# One index per table; keys are only unique within a table
+network_log_keys = IdempotencyIndex()
+feedback_keys = IdempotencyIndex()
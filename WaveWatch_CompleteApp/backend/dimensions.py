@@ -0,0 +1,179 @@
+"""
+Dictionary encoding of low-cardinality string columns.
+
+carrier, network_type, device_info, app_version and issue_type repeat a few
+distinct strings in every row. Their columns store an integer id into
+dimension_values (kind, value) instead, which shrinks the largest tables
+and every index that includes these columns.
+
+DictionaryEncoded maps strings to ids on the way in and ids back to
+strings on the way out, from an in-process cache, so inserts, filters and
+results keep using plain strings and no query joins the dimension table.
+A value seen for the first time is inserted in its own short transaction
+(ON CONFLICT DO NOTHING, so concurrent workers agree on one id); ids are
+never deleted or reused, so cached entries never go stale. Comparisons
+(carrier == "MTN") only look values up: an unknown string matches no row
+instead of creating a dimension value.
+
+In SQLite embedded mode the writer thread holds the write lock, so ingest
+resolves new values with prepare_records() before queueing its write.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.types import TypeDecorator
+
+from database import engine
+from sqlite_local import WRITER_THREAD_NAME
+
+UNKNOWN_ID = -1  # Bound for strings that were never stored; matches no row
+
+
+class DimensionCache:
+    """(kind, value) <-> id maps, filled from dimension_values on demand"""
+
+    def __init__(self):
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self._values: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "created": 0, "reloads": 0}
+
+    @staticmethod
+    def _table():
+        from models import DimensionValue
+        return DimensionValue.__table__
+
+    def _remember(self, kind: str, rows):
+        with self._lock:
+            for row_id, value in rows:
+                self._ids[(kind, value)] = row_id
+                self._values[row_id] = value
+
+    def _resolve(self, kind: str, values: List[str], create: bool) -> Dict[str, int]:
+        if create and threading.current_thread().name == WRITER_THREAD_NAME:
+            # Inserting would wait for the write lock this thread holds
+            create = False
+        table = self._table()
+        with engine.begin() as conn:
+            if create:
+                insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+                created = conn.execute(
+                    insert(table).on_conflict_do_nothing(), [{"kind": kind, "value": value} for value in values]
+                )
+                self.stats["created"] += max(created.rowcount, 0)
+            rows = conn.execute(
+                select(table.c.id, table.c.value).where(table.c.kind == kind, table.c.value.in_(values))
+            ).all()
+        self.stats["lookups"] += 1
+        self._remember(kind, rows)
+        return {value: row_id for row_id, value in rows}
+
+    def id_for(self, kind: str, value: str, create: bool = True) -> Optional[int]:
+        row_id = self._ids.get((kind, value))
+        if row_id is None:
+            row_id = self._resolve(kind, [value], create).get(value)
+            if row_id is None and create:
+                raise RuntimeError(f"New {kind} value {value!r} must be prepared before queueing the write")
+        return row_id
+
+    def value_for(self, row_id: int) -> Optional[str]:
+        value = self._values.get(row_id)
+        if value is None:
+            # Created by another process; the table is small, reload it whole
+            table = self._table()
+            with engine.connect() as conn:
+                rows = conn.execute(select(table.c.kind, table.c.id, table.c.value)).all()
+            self.stats["reloads"] += 1
+            for kind, row_id_, value_ in rows:
+                self._remember(kind, [(row_id_, value_)])
+            value = self._values.get(row_id)
+        return value
+
+    def prepare(self, kind: str, values: Iterable[Optional[str]]):
+        """Make sure all values have ids, with one round trip for the new ones"""
+        missing = {
+            str(value) for value in values if value is not None and (kind, str(value)) not in self._ids
+        }
+        if missing:
+            self._resolve(kind, sorted(missing), create=True)
+
+    def status(self) -> dict:
+        return {"values": len(self._values), **self.stats}
+
+
+dimension_cache = DimensionCache()
+
+
+class DictionaryEncoded(TypeDecorator):
+    """String column stored as an integer id into dimension_values"""
+
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+
+    @property
+    def python_type(self):
+        return str
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else dimension_cache.id_for(self.kind, str(value))
+
+    def process_literal_param(self, value, dialect):
+        return self.process_bind_param(value, dialect)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else dimension_cache.value_for(value)
+
+    def coerce_compared_value(self, op, value):
+        return DictionaryLookup(self.kind)
+
+
+class DictionaryLookup(TypeDecorator):
+    """Comparison side of DictionaryEncoded: never creates dimension values"""
+
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        row_id = dimension_cache.id_for(self.kind, str(value), create=False)
+        return UNKNOWN_ID if row_id is None else row_id
+
+    def process_literal_param(self, value, dialect):
+        return self.process_bind_param(value, dialect)
+
+
+def dictionary_columns(model) -> List[Tuple[str, str]]:
+    """(column name, dimension kind) of a model's dictionary-encoded columns"""
+    return [(col.name, col.type.kind) for col in model.__table__.c if isinstance(col.type, DictionaryEncoded)]
+
+
+def prepare_records(model, records: List[dict]):
+    """Resolve new dimension values of row dicts before queueing their insert"""
+    for name, kind in dictionary_columns(model):
+        dimension_cache.prepare(kind, (record.get(name) for record in records))
+
+
+def prepare_columns(model, columns: Dict[str, list], constants: Optional[dict] = None):
+    """prepare_records() for a columnar batch: column lists plus shared values"""
+    for name, kind in dictionary_columns(model):
+        values = list(columns.get(name, []))
+        if constants and name in constants:
+            values.append(constants[name])
+        dimension_cache.prepare(kind, values)
+
+
+def encode_values(column, values: List[Optional[str]]) -> List[Optional[int]]:
+    """Ids for raw SQL that bypasses type processing (e.g. PostgreSQL unnest arrays)"""
+    kind = column.type.kind
+    return [None if value is None else dimension_cache.id_for(kind, str(value)) for value in values]
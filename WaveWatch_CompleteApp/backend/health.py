@@ -0,0 +1,139 @@
+"""
+Cached health state for the liveness / readiness probes.
+
+A background prober checks the database (one SELECT 1 round trip, bounded
+by HEALTH_PROBE_TIMEOUT_SECONDS) and reads the connection pool counters every
+HEALTH_PROBE_INTERVAL_SECONDS. /livez, /readyz and /health answer from the
+cached state, so frequent orchestrator probes never touch the database and a
+slow database shows up as "not ready" instead of a hung (dead-looking) pod.
+
+Readiness fails when the last probe failed or is older than
+HEALTH_STALE_SECONDS (the prober itself is stuck). Liveness only says the
+event loop is serving requests.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+HEALTH_PROBE_INTERVAL_SECONDS = float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "5"))
+HEALTH_PROBE_TIMEOUT_SECONDS = float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "3"))
+HEALTH_STALE_SECONDS = float(os.getenv("HEALTH_STALE_SECONDS", str(3 * HEALTH_PROBE_INTERVAL_SECONDS)))
+
+STARTED_AT = time.monotonic()
+
+health_state: Dict[str, Any] = {
+    "database": {
+        "ok": None,
+        "checked_at": None,
+        "latency_ms": None,
+        "error": None,
+        "consecutive_failures": 0,
+        "last_ok_at": None,
+    },
+    "pool": None,
+    "probes": 0,
+}
+# Monotonic time of the last finished probe, for the staleness check
+_last_probe: Optional[float] = None
+
+
+def pool_status(engine) -> Optional[Dict[str, Any]]:
+    """Connection pool counters (QueuePool only; other pools report their class)"""
+    if engine is None:
+        return None
+    pool = engine.pool
+    status = {"class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        counter = getattr(pool, name, None)
+        if callable(counter):
+            status[name] = counter()
+    return status
+
+
+def _ping(engine) -> float:
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+async def probe_once(engine) -> Dict[str, Any]:
+    """Run one probe and update health_state"""
+    global _last_probe
+    database = dict(health_state["database"])
+    try:
+        if engine is None:
+            raise RuntimeError("No database engine")
+        # A hung connect leaves its worker thread behind, but the probe (and
+        # readiness) moves on; the pool's own timeouts release it later
+        database["latency_ms"] = await asyncio.wait_for(
+            run_in_threadpool(_ping, engine), timeout=HEALTH_PROBE_TIMEOUT_SECONDS
+        )
+        database.update(ok=True, error=None, consecutive_failures=0)
+    except asyncio.TimeoutError:
+        database.update(ok=False, latency_ms=None, error=f"Timed out after {HEALTH_PROBE_TIMEOUT_SECONDS}s")
+        database["consecutive_failures"] += 1
+    except Exception as e:
+        database.update(ok=False, latency_ms=None, error=str(e))
+        database["consecutive_failures"] += 1
+
+    now = datetime.now(timezone.utc)
+    database["checked_at"] = now.isoformat()
+    if database["ok"]:
+        database["last_ok_at"] = database["checked_at"]
+    health_state["database"] = database
+    health_state["pool"] = pool_status(engine)
+    health_state["probes"] += 1
+    _last_probe = time.monotonic()
+    return database
+
+
+def probe_age() -> Optional[float]:
+    return round(time.monotonic() - _last_probe, 3) if _last_probe is not None else None
+
+
+def readiness(database_required: bool = True) -> Tuple[bool, Dict[str, Any]]:
+    """(ready, body) from the cached state; never touches the database"""
+    age = probe_age()
+    if not database_required:
+        # In-memory mode serves requests without a database
+        ready, reason = True, None
+    elif age is None:
+        ready, reason = False, "Database not probed yet"
+    elif age > HEALTH_STALE_SECONDS:
+        ready, reason = False, f"Last database probe is {age:.0f}s old"
+    elif not health_state["database"]["ok"]:
+        ready, reason = False, health_state["database"]["error"]
+    else:
+        ready, reason = True, None
+    body = {
+        "status": "ready" if ready else "not ready",
+        "reason": reason,
+        "database": health_state["database"] if database_required else "in-memory mode",
+        "probe_age_seconds": age,
+        "pool": health_state["pool"],
+    }
+    return ready, body
+
+
+def liveness() -> Dict[str, Any]:
+    return {"status": "alive", "uptime_seconds": round(time.monotonic() - STARTED_AT, 1)}
+
+
+async def health_prober(engine):
+    """Background loop started by the API; the first probe runs at startup"""
+    while True:
+        await asyncio.sleep(HEALTH_PROBE_INTERVAL_SECONDS)
+        try:
+            was_ok = health_state["database"]["ok"]
+            database = await probe_once(engine)
+            if database["ok"] != was_ok:
+                print(f"{'✅' if database['ok'] else '❌'} Database health changed: "
+                      f"{'ok' if database['ok'] else database['error']}")
+        except Exception as e:
+            print(f"⚠️ Health probe failed: {e}")
@@ -0,0 +1,249 @@
+"""
+Streaming ingest helpers for large offline backlogs uploaded by the mobile app
+"""
+import os
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from schemas import NetworkLogCreate
+from serialization import json_loads
+
+# zstd is optional; gzip is always available through zlib
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    print("⚠️ zstandard library not available, zstd request bodies will be rejected")
+
+# Number of validated records inserted per database round trip
+NDJSON_CHUNK_SIZE = int(os.getenv("NDJSON_CHUNK_SIZE", "500"))
+
+# A single NetworkLog record is a few hundred bytes; anything larger is garbage
+MAX_NDJSON_LINE_BYTES = int(os.getenv("MAX_NDJSON_LINE_BYTES", str(64 * 1024)))
+
+# Only the first few rejected lines are echoed back in the summary
+MAX_REPORTED_ERRORS = 20
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# Zip-bomb protection: hard caps on the decompressed size of a request body
+MAX_DECOMPRESSED_BODY_BYTES = int(os.getenv("MAX_DECOMPRESSED_BODY_BYTES", str(10 * 1024 * 1024)))
+MAX_DECOMPRESSED_STREAM_BYTES = int(os.getenv("MAX_DECOMPRESSED_STREAM_BYTES", str(512 * 1024 * 1024)))
+
+# Decompressed output is produced in slices of at most this size, so a tiny
+# malicious chunk can never expand into a huge allocation in one call
+DECOMPRESS_SLICE_BYTES = 64 * 1024
+
+# zstd has no output cap per call; feeding small input slices bounds the
+# worst case (RLE blocks) to a few MB per call
+ZSTD_FEED_BYTES = 256
+
+# Process-wide counters reported by /health
+ingest_metrics = {
+    "requests": 0,
+    "compressed_requests": 0,
+    "wire_bytes": 0,
+    "decompressed_bytes": 0,
+    "by_encoding": {}
+}
+
+
+def _gzip_decompressor() -> Callable[[bytes], Iterator[bytes]]:
+    # 32 + MAX_WBITS auto-detects a gzip or zlib header
+    decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+
+    def feed(data: bytes):
+        while data:
+            out = decompressor.decompress(data, DECOMPRESS_SLICE_BYTES)
+            data = decompressor.unconsumed_tail
+            if out:
+                yield out
+            if decompressor.eof:
+                # Concatenated gzip members are rare for uploads; treat trailing bytes as an error
+                if decompressor.unused_data.strip(b"\x00"):
+                    raise ValueError("Unexpected data after end of gzip stream")
+                return
+
+    return feed
+
+
+def _zstd_decompressor() -> Callable[[bytes], Iterator[bytes]]:
+    decompressor = zstandard.ZstdDecompressor(max_window_size=8 * 1024 * 1024).decompressobj()
+
+    def feed(data: bytes):
+        for i in range(0, len(data), ZSTD_FEED_BYTES):
+            out = decompressor.decompress(data[i:i + ZSTD_FEED_BYTES])
+            if out:
+                yield out
+
+    return feed
+
+
+def _identity_decompressor() -> Callable[[bytes], Iterator[bytes]]:
+    def feed(data: bytes):
+        yield data
+
+    return feed
+
+
+def _make_decompressor(encoding: str):
+    if encoding in ("", "identity"):
+        return _identity_decompressor()
+    if encoding in ("gzip", "x-gzip"):
+        return _gzip_decompressor()
+    if encoding == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise HTTPException(status_code=415, detail="zstd Content-Encoding is not supported by this server")
+        return _zstd_decompressor()
+    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+
+
+async def decoded_stream(request: Request, max_bytes: int = MAX_DECOMPRESSED_STREAM_BYTES,
+                         stats: Optional[Dict[str, Any]] = None) -> AsyncIterator[bytes]:
+    """Yield the request body, incrementally decompressed per its Content-Encoding.
+
+    Raises 413 as soon as the decompressed size passes ``max_bytes`` and 400
+    when the compressed data is corrupt. Compressed (wire) and decompressed
+    byte counts are added to ``stats`` and to the process-wide ingest_metrics.
+    """
+    encoding = (request.headers.get("content-encoding") or "identity").strip().lower()
+    feed = _make_decompressor(encoding)
+    wire_bytes = 0
+    decompressed_bytes = 0
+
+    try:
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            wire_bytes += len(chunk)
+            for out in feed(chunk):
+                decompressed_bytes += len(out)
+                if decompressed_bytes > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Decompressed body exceeds {max_bytes} bytes"
+                    )
+                yield out
+    except (zlib.error, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid {encoding} body: {str(e)}")
+    except Exception as e:
+        if ZSTD_AVAILABLE and isinstance(e, zstandard.ZstdError):
+            raise HTTPException(status_code=400, detail=f"Invalid zstd body: {str(e)}")
+        raise
+    finally:
+        _record_transfer(encoding, wire_bytes, decompressed_bytes, stats)
+
+
+def _record_transfer(encoding: str, wire_bytes: int, decompressed_bytes: int, stats: Optional[Dict[str, Any]]):
+    ingest_metrics["requests"] += 1
+    ingest_metrics["wire_bytes"] += wire_bytes
+    ingest_metrics["decompressed_bytes"] += decompressed_bytes
+    if encoding not in ("", "identity"):
+        ingest_metrics["compressed_requests"] += 1
+    per_encoding = ingest_metrics["by_encoding"].setdefault(
+        encoding, {"requests": 0, "wire_bytes": 0, "decompressed_bytes": 0}
+    )
+    per_encoding["requests"] += 1
+    per_encoding["wire_bytes"] += wire_bytes
+    per_encoding["decompressed_bytes"] += decompressed_bytes
+
+    if stats is not None:
+        stats["content_encoding"] = encoding
+        stats["wire_bytes"] = wire_bytes
+        stats["decompressed_bytes"] = decompressed_bytes
+
+
+async def read_body(request: Request, max_bytes: int = MAX_DECOMPRESSED_BODY_BYTES) -> bytes:
+    """Read a whole (possibly compressed) request body for single-record endpoints"""
+    chunks = []
+    async for chunk in decoded_stream(request, max_bytes=max_bytes):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def is_ndjson(content_type: str) -> bool:
+    """Check if a Content-Type header denotes newline-delimited JSON"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return media_type in NDJSON_CONTENT_TYPES
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Union[bytes, Exception]]]:
+    """Split an async byte stream into lines without buffering the whole body.
+
+    Yields ``(line_number, line)`` for every non-blank line, or
+    ``(line_number, error)`` when a line exceeds MAX_NDJSON_LINE_BYTES.
+    """
+    buffer = bytearray()
+    line_no = 0
+    skipping = False  # True while discarding the tail of an oversized line
+
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buffer.extend(chunk)
+
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            line = bytes(buffer[start:end]).strip()
+            start = end + 1
+            if skipping:
+                skipping = False
+                continue
+            line_no += 1
+            if line:
+                yield line_no, line
+        del buffer[:start]
+
+        if len(buffer) > MAX_NDJSON_LINE_BYTES:
+            if not skipping:
+                line_no += 1
+                yield line_no, ValueError(f"Line exceeds {MAX_NDJSON_LINE_BYTES} bytes")
+            skipping = True
+            buffer.clear()
+
+    tail = bytes(buffer).strip()
+    if tail and not skipping:
+        yield line_no + 1, tail
+
+
+def validate_network_log(line: bytes) -> Dict[str, Any]:
+    """Decode and validate one NDJSON line into insertable NetworkLog values"""
+    record = json_loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Each line must be a JSON object")
+    log = NetworkLogCreate(**record)
+    # Leave unset columns (e.g. timestamp) to their server defaults
+    return log.model_dump(exclude_none=True)
+
+
+def describe_error(error: Exception) -> str:
+    """Short, client-facing description of why a line was rejected"""
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in error.errors()
+        )
+    return str(error)
+
+
+def new_ingest_summary() -> Dict[str, Any]:
+    return {
+        "received": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "stored_in_memory": 0,
+        "rejected": 0,
+        "chunks": 0,
+        "errors": []
+    }
+
+
+def record_rejection(summary: Dict[str, Any], line_no: int, error: Exception):
+    summary["rejected"] += 1
+    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({"line": line_no, "error": describe_error(error)})
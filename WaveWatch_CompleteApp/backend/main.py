@@ -1,14 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Body
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Body, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import text, inspect
-from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime, timedelta
 import os
 import json
+import asyncio
 from typing import List, Optional, Dict, Any, Union
 import uvicorn
 from dotenv import load_dotenv
+from pydantic import ValidationError
+from serialization import (
+    DefaultResponse, MSGPACK_AVAILABLE, admin_feedback, decode_body, is_msgpack, wants_msgpack, negotiated_response, rows_response,
+    network_log_list, feedback_list, recommendation_list
+)
+from binary_batch import BATCH_MEDIA_TYPE, BinaryBatchError, decode_batch, is_binary_batch
+from compression import CompressionMiddleware, PrecompressedBody, compression_metrics
+from response_cache import (
+    recommendations_cache, analytics_cache, aggregate_versions, validator_headers, is_not_modified, not_modified_response
+)
+from exports import export_response, iter_query_chunks, iter_memory_chunks
+from health import health_prober, health_state, liveness, probe_age, probe_once, readiness
+from ingest import (
+    NDJSON_CHUNK_SIZE, is_ndjson, iter_ndjson_lines, validate_network_log,
+    new_ingest_summary, record_rejection, decoded_stream, read_body, ingest_metrics,
+    describe_error
+)
 
 # JWT import with proper error handling
 try:
@@ -27,7 +47,11 @@ feedback_memory = []
 logs_memory = []
 
 try:
-    from database import get_db, engine, test_connection, get_connection_info
+    from database import (
+        get_db, engine, test_connection, SessionLocal, ReadSessionLocal, replica_state, sqlite_writer
+    )
+    from dedup import network_log_keys, feedback_keys
+    from dimensions import dimension_cache, prepare_columns, prepare_records
     from models import Base, User, Feedback, NetworkLog
     from schemas import (
         UserCreate, UserLogin, UserResponse, Token,
@@ -36,11 +60,24 @@ try:
         RecommendationResponse
     )
     from crud import (
-        create_user, authenticate_user, get_user_by_username,
+        create_user, authenticate_user,
         create_feedback, get_feedbacks, create_network_log,
-        get_network_logs, get_provider_recommendations
+        get_network_logs, get_provider_recommendations,
+        create_network_logs_bulk, create_feedbacks_bulk,
+        select_network_logs, select_feedbacks, create_network_logs_columnar,
+        get_provider_analytics
+    )
+    from parquet_export import run_parquet_export, load_manifest, PYARROW_AVAILABLE
+    from archive import ARCHIVE_AFTER_DAYS, archive_worker, load_archive_manifest, rehydrate, run_archive
+    from analytics_store import ANALYTICS_STORE_ENABLED, analytics_sync_worker, store_status
+    import analytics_store
+    from rollups import (
+        ROLLUPS_ENABLED, BUCKET_SIZES, rollup_metrics, rollup_worker, run_rollups, query_rollups
     )
     DATABASE_AVAILABLE = test_connection()
+    if sqlite_writer is not None:
+        # Ids remembered for a group whose commit failed were never stored
+        sqlite_writer.on_failed_commit += [network_log_keys.forget_recent, feedback_keys.forget_recent]
     print(f"✅ Database modules imported. Connection: {'✅' if DATABASE_AVAILABLE else '❌'}")
 except Exception as e:
     print(f"⚠️ Database modules not available: {e}")
@@ -74,7 +111,8 @@ except Exception as e:
 app = FastAPI(
     title="QoE Boost API",
     description="Quality of Experience monitoring and feedback API with Supabase",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultResponse
 )
 
 # CORS middleware
@@ -86,6 +124,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for list, export and recommendation responses
+app.add_middleware(CompressionMiddleware)
+
 # Security
 security = HTTPBearer()
 
@@ -147,18 +188,45 @@ async def root():
         "database": "Connected" if DATABASE_AVAILABLE else "In-Memory Mode",
         "jwt": "Available" if JWT_AVAILABLE else "Fallback Mode",
         "passlib": "Available" if PASSLIB_AVAILABLE else "Fallback Mode",
+        "msgpack": "Available" if MSGPACK_AVAILABLE else "JSON Only",
         "endpoints": {
             "auth": ["/auth/register", "/auth/login"],
             "feedback": ["/feedback"],
-            "network-logs": ["/network-logs"],
-            "debug": ["/health", "/debug/routes", "/debug/echo"]
+            "network-logs": ["/network-logs", "/network-logs/stream", "/network-logs/batch"],
+            "recommendations": ["/recommendations"],
+            "admin": ["/analytics", "/analytics/sync", "/feedbacks", "/rollups"],
+            "export": ["/export/network-logs", "/export/feedback", "/export/parquet"],
+            "archive": ["/archive/run", "/archive/rehydrate", "/archive/manifest"],
+            "debug": ["/health", "/livez", "/readyz", "/debug/routes", "/debug/echo"]
         }
     }
 
+@app.get("/livez")
+async def livez():
+    """Liveness: the process serves requests; never depends on the database"""
+    return liveness()
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    """Readiness from the cached background probe (503 when not ready)"""
+    ready, body = readiness(database_required=DATABASE_AVAILABLE)
+    if not ready:
+        response.status_code = 503
+    return body
+
 @app.get("/health")
 async def health_check():
     try:
-        connection_info = get_connection_info() if DATABASE_AVAILABLE else None
+        # Cached by the background prober instead of a round trip per request
+        connection_info = {
+            **health_state["database"],
+            "probe_age_seconds": probe_age(),
+            "pool": health_state["pool"],
+            "read_replica": replica_state,
+            "analytics_store": store_status(),
+            "sqlite_writer": sqlite_writer.stats if sqlite_writer is not None else None,
+            "dimensions": dimension_cache.status()
+        } if DATABASE_AVAILABLE else None
         return {
             "status": "healthy",
             "database": "connected" if DATABASE_AVAILABLE else "in-memory mode",
@@ -170,7 +238,12 @@ async def health_check():
                 "users": len(users_memory),
                 "feedback": len(feedback_memory),
                 "logs": len(logs_memory)
-            }
+            },
+            "ingest_stats": ingest_metrics,
+        "compression_stats": compression_metrics,
+        "recommendations_cache": recommendations_cache.stats,
+        "analytics_cache": analytics_cache.stats,
+        "rollups": rollup_metrics if DATABASE_AVAILABLE else None
         }
     except Exception as e:
         return {
@@ -191,17 +264,93 @@ async def list_routes():
             })
     return {"routes": routes}
 
+@app.on_event("startup")
+async def start_background_jobs():
+    if DATABASE_AVAILABLE:
+        # First probe before serving, so /readyz is accurate from the start
+        await probe_once(engine)
+        app.state.health_task = asyncio.create_task(health_prober(engine))
+        from database_manager import SCHEMA_RECONCILE_ON_STARTUP, db_manager
+        if SCHEMA_RECONCILE_ON_STARTUP:
+            # Near-free when the stored schema fingerprint matches the models
+            await run_in_threadpool(db_manager.safe_initialize_database)
+    if DATABASE_AVAILABLE and ROLLUPS_ENABLED:
+        # Keep a reference so the task is not garbage collected
+        app.state.rollup_task = asyncio.create_task(rollup_worker())
+        print("✅ Rollup job started")
+    if DATABASE_AVAILABLE and PYARROW_AVAILABLE and ARCHIVE_AFTER_DAYS > 0:
+        app.state.archive_task = asyncio.create_task(archive_worker())
+        print(f"✅ Archive job started (rows older than {ARCHIVE_AFTER_DAYS} days)")
+    if DATABASE_AVAILABLE and ANALYTICS_STORE_ENABLED:
+        app.state.analytics_sync_task = asyncio.create_task(analytics_sync_worker())
+        print("✅ Analytics replica sync started")
+
 # Helper function to parse request body
 async def parse_body(request: Request) -> Dict[str, Any]:
-    """Parse request body as JSON, handling both raw string and JSON object"""
+    """Parse request body as JSON or MessagePack, handling both raw string and object"""
     try:
-        body = await request.body()
-        body_str = body.decode('utf-8')
-        print(f"Raw request body: {body_str}")
-        return json.loads(body_str)
+        # Transparently handles Content-Encoding: gzip / zstd with size limits
+        body = await read_body(request)
+        print(f"Raw request body: {body[:500]!r}")
+        # JSON by default, MessagePack for Content-Type: application/msgpack
+        return decode_body(body, request.headers.get("content-type"))
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error parsing request body: {e}")
-        raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+        print(f"Error parsing request body: {e!r}")
+        body_format = "MessagePack" if is_msgpack(request.headers.get("content-type")) else "JSON"
+        raise HTTPException(status_code=400, detail=f"Invalid {body_format}: {str(e) or type(e).__name__}")
+
+async def run_db_read(read, *args, **kwargs):
+    """Run a crud read in the threadpool with its own session.
+
+    The session is not tied to a request, so this is safe for cached loaders
+    that may finish (or refresh in the background) after the request that
+    started them. It reads from the replica when one is configured and usable.
+    """
+    def call():
+        db = ReadSessionLocal()
+        try:
+            return read(db, *args, **kwargs)
+        finally:
+            db.close()
+    return await run_in_threadpool(call)
+
+async def run_db_write(write, *args, **kwargs):
+    """Run a crud write with its own session.
+
+    In SQLite embedded mode it goes through the single writer queue and is
+    committed together with other queued writes; otherwise it runs in the
+    threadpool like run_db_read.
+    """
+    if sqlite_writer is not None:
+        return await sqlite_writer.run(write, *args, **kwargs)
+
+    def call():
+        db = SessionLocal()
+        try:
+            return write(db, *args, **kwargs)
+        finally:
+            db.close()
+    return await run_in_threadpool(call)
+
+async def cached_aggregate(request: Request, cache, scope: str, version: int, last_modified: float, compute):
+    """Serve an aggregate read with conditional GET, caching and single-flight.
+
+    compute() builds the full Response; it only runs when the client's
+    validators are stale and no cached body exists for this version.
+    """
+    body_format = "msgpack" if wants_msgpack(request) else "json"
+    validators = validator_headers(aggregate_versions.etag(f"{scope}:{body_format}", version), last_modified)
+    if is_not_modified(request, validators["ETag"], last_modified):
+        return not_modified_response({**validators, "Vary": "Accept"})
+
+    async def load():
+        response = await compute()
+        return PrecompressedBody(response.body, response.media_type, {**validators, "Vary": "Accept"})
+
+    cached = await cache.get_or_load((scope, body_format, version), load)
+    return cached.response(request)
 
 # Authentication endpoints with fallback to in-memory storage
 @app.post("/auth/register")
@@ -211,20 +360,22 @@ async def register(request: Request):
         user = UserCreate(**data)
         
         if DATABASE_AVAILABLE:
+            db = next(get_db())
             try:
-                db = next(get_db())
-                # Check if user already exists
-                db_user = get_user_by_username(db, username=user.username)
-                if db_user:
-                    raise HTTPException(status_code=400, detail="Username already registered")
-                
-                # Create new user
+                # Single INSERT ... ON CONFLICT (username) DO NOTHING RETURNING
                 new_user = create_user(db=db, user=user)
-                db.close()
+                if new_user is None:
+                    raise HTTPException(status_code=400, detail="Username already registered")
                 return new_user
+            except HTTPException:
+                raise
+            except IntegrityError:
+                raise HTTPException(status_code=400, detail="Email already registered")
             except Exception as db_error:
                 print(f"Database error, falling back to memory: {db_error}")
                 # Fall through to memory storage
+            finally:
+                db.close()
         
         # In-memory storage fallback
         if user.username in users_memory:
@@ -323,6 +474,29 @@ async def echo_request(request: Request):
 async def submit_feedback(request: Request):
     try:
         data = await parse_body(request)
+        
+        # Try to save to database first
+        if DATABASE_AVAILABLE:
+            try:
+                feedback = FeedbackCreate(**data).model_dump(exclude_none=True)
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=describe_error(e))
+            
+            try:
+                # Anonymous user; retries with the same device_id/local_id are stored once
+                await run_in_threadpool(prepare_records, Feedback, [feedback])
+                result = (await run_db_write(create_feedbacks_bulk, [feedback], 1))[0]
+                return negotiated_response(request, {
+                    **feedback,
+                    "id": result["id"],
+                    "timestamp": result["timestamp"] or feedback.get("timestamp"),
+                    "storage": "database",
+                    "duplicate": result["duplicate"]
+                })
+            except Exception as db_error:
+                print(f"Database error, falling back to memory: {db_error}")
+                # Fall through to memory storage
+        
         feedback_id = len(feedback_memory) + 1
         feedback = {
             "id": feedback_id,
@@ -331,19 +505,58 @@ async def submit_feedback(request: Request):
             **data
         }
         feedback_memory.append(feedback)
-        return feedback
+        return negotiated_response(request, feedback)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Feedback error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to submit feedback: {str(e)}")
 
 @app.get("/feedback")
-async def get_user_feedback():
-    return feedback_memory
+async def get_user_feedback(request: Request, carrier: Optional[str] = None, location: Optional[str] = None,
+                            since: Optional[datetime] = None, until: Optional[datetime] = None,
+                            skip: int = 0, limit: int = 100):
+    if DATABASE_AVAILABLE:
+        db = await run_in_threadpool(ReadSessionLocal)
+        try:
+            rows = await run_in_threadpool(
+                get_feedbacks, db, skip=skip, limit=limit,
+                carrier=carrier, location=location, since=since, until=until
+            )
+            return rows_response(feedback_list, rows, request)
+        except Exception as db_error:
+            print(f"Database error, falling back to memory: {db_error}")
+        finally:
+            db.close()
+    return negotiated_response(request, feedback_memory)
 
 @app.post("/network-logs")
 async def submit_network_log(request: Request):
     try:
         data = await parse_body(request)
+        
+        # Try to save to database first
+        if DATABASE_AVAILABLE:
+            try:
+                log = NetworkLogCreate(**data).model_dump(exclude_none=True)
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=describe_error(e))
+            
+            try:
+                # Anonymous user; retries with the same device_id/local_id are stored once
+                await run_in_threadpool(prepare_records, NetworkLog, [log])
+                result = (await run_db_write(create_network_logs_bulk, [log], 1))[0]
+                return negotiated_response(request, {
+                    **log,
+                    "id": result["id"],
+                    "timestamp": result["timestamp"] or log.get("timestamp"),
+                    "storage": "database",
+                    "duplicate": result["duplicate"]
+                })
+            except Exception as db_error:
+                print(f"Database error, falling back to memory: {db_error}")
+                # Fall through to memory storage
+        
         log_id = len(logs_memory) + 1
         log = {
             "id": log_id,
@@ -352,14 +565,359 @@ async def submit_network_log(request: Request):
             **data
         }
         logs_memory.append(log)
-        return log
+        return negotiated_response(request, log)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Network log error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to submit network log: {str(e)}")
 
 @app.get("/network-logs")
-async def get_user_network_logs():
-    return logs_memory
+async def get_user_network_logs(request: Request, carrier: Optional[str] = None, location: Optional[str] = None,
+                                since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                skip: int = 0, limit: int = 100):
+    if DATABASE_AVAILABLE:
+        db = await run_in_threadpool(ReadSessionLocal)
+        try:
+            rows = await run_in_threadpool(
+                get_network_logs, db, skip=skip, limit=limit,
+                carrier=carrier, location=location, since=since, until=until
+            )
+            return rows_response(network_log_list, rows, request)
+        except Exception as db_error:
+            print(f"Database error, falling back to memory: {db_error}")
+        finally:
+            db.close()
+    return negotiated_response(request, logs_memory)
+
+@app.get("/recommendations")
+async def get_recommendations(request: Request, location: str):
+    if not DATABASE_AVAILABLE:
+        return negotiated_response(request, [])
+
+    # Conditional GET: the version only changes when logs for this location are ingested
+    version, last_modified = aggregate_versions.for_location(location)
+
+    async def compute():
+        recommendations = await run_db_read(get_provider_recommendations, location)
+        return rows_response(recommendation_list, recommendations, request)
+
+    try:
+        return await cached_aggregate(
+            request, recommendations_cache, f"recommendations:{location.lower()}",
+            version, last_modified, compute
+        )
+    except Exception as e:
+        print(f"Recommendations error: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
+
+# Admin app endpoints (ApiService.getAnalytics / getFeedbacks)
+@app.get("/analytics")
+async def get_analytics(request: Request, provider: str):
+    """Per-location network and feedback averages for one provider"""
+    if not DATABASE_AVAILABLE:
+        return negotiated_response(request, {"analytics": analytics_from_memory(provider)})
+
+    version, last_modified = aggregate_versions.for_carrier(provider)
+
+    # Served by the DuckDB replica when it is enabled and fresh; its sync
+    # generation is part of the key, so synced rows replace cached answers
+    use_store = analytics_store.is_ready()
+    scope = f"analytics:{provider}"
+    if use_store:
+        scope += f":duckdb:{analytics_store.analytics_metrics['generation']}"
+
+    async def compute():
+        if use_store:
+            analytics = await run_in_threadpool(analytics_store.get_provider_analytics, provider)
+        else:
+            analytics = await run_db_read(get_provider_analytics, provider)
+        return negotiated_response(request, {"analytics": analytics})
+
+    try:
+        return await cached_aggregate(request, analytics_cache, scope, version, last_modified, compute)
+    except Exception as e:
+        print(f"Analytics error: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get analytics: {str(e)}")
+
+@app.get("/feedbacks")
+async def get_provider_feedback(request: Request, provider: str, skip: int = 0, limit: int = 100):
+    """Latest feedback for one provider in the admin app's format"""
+    if DATABASE_AVAILABLE:
+        version, last_modified = aggregate_versions.for_carrier(provider)
+        validators = validator_headers(
+            aggregate_versions.etag(f"feedbacks:{provider}:{skip}:{limit}", version), last_modified
+        )
+        if is_not_modified(request, validators["ETag"], last_modified):
+            return not_modified_response(validators)
+        try:
+            rows = await run_db_read(get_feedbacks, skip=skip, limit=limit, carrier=provider)
+            response = negotiated_response(request, {"feedbacks": [admin_feedback(row) for row in rows]})
+            response.headers.update(validators)
+            return response
+        except Exception as db_error:
+            print(f"Database error, falling back to memory: {db_error}")
+
+    feedbacks = [admin_feedback(f) for f in reversed(feedback_memory) if f.get("carrier") == provider]
+    return negotiated_response(request, {"feedbacks": feedbacks[skip:skip + limit]})
+
+@app.get("/rollups")
+async def get_rollups(since: datetime, until: Optional[datetime] = None, location: Optional[str] = None,
+                      carrier: Optional[str] = None, level: Optional[str] = None):
+    """Bucketed network metrics for dashboards, served from minute/hour/day rollups"""
+    if not DATABASE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Rollups require the database")
+    if level is not None and level not in BUCKET_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown level: {level}. Use {', '.join(BUCKET_SIZES)}")
+    try:
+        return await run_db_read(query_rollups, since, until, location=location, carrier=carrier, level=level)
+    except Exception as e:
+        print(f"Rollups error: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get rollups: {str(e)}")
+
+@app.post("/rollups/run")
+async def trigger_rollups():
+    """Run one rollup pass now (the background job runs every ROLLUP_INTERVAL_SECONDS)"""
+    if not DATABASE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Rollups require the database")
+    return await run_in_threadpool(run_rollups)
+
+@app.post("/analytics/sync")
+async def trigger_analytics_sync():
+    """Sync new rows into the DuckDB analytics replica now"""
+    if not DATABASE_AVAILABLE or not ANALYTICS_STORE_ENABLED:
+        raise HTTPException(status_code=503, detail="Analytics replica requires the database, duckdb and ANALYTICS_DUCKDB_PATH")
+    return {"synced": await run_in_threadpool(analytics_store.run_sync), "status": store_status()}
+
+def analytics_from_memory(provider: str) -> List[Dict[str, Any]]:
+    """In-memory equivalent of crud.get_provider_analytics"""
+    metrics = ("latency", "jitter", "packet_loss", "signal_strength", "user_rating")
+    by_location: Dict[str, Dict[str, List[float]]] = {}
+    for log in logs_memory:
+        if log.get("carrier") == provider:
+            values = by_location.setdefault(log.get("location"), {name: [] for name in metrics})
+            for name in metrics[:4]:
+                if log.get(name) is not None:
+                    values[name].append(log[name])
+    for feedback in feedback_memory:
+        if feedback.get("carrier") == provider:
+            values = by_location.setdefault(feedback.get("location"), {name: [] for name in metrics})
+            values["user_rating"].append(feedback.get("overall_satisfaction", 0))
+
+    def average(values):
+        return round(sum(values) / len(values), 2) if values else 0.0
+
+    return [
+        {
+            "location": location,
+            **{f"avg_{name}": average(values[name]) for name in metrics},
+            "total_feedbacks": len(values["user_rating"]),
+        }
+        for location, values in sorted(by_location.items(), key=lambda item: str(item[0]))
+    ]
+
+# Streaming exports for the admin app: same filters as the list endpoints
+@app.get("/export/network-logs")
+async def export_network_logs(format: str = "csv", carrier: Optional[str] = None,
+                              location: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None):
+    if DATABASE_AVAILABLE:
+        stmt = select_network_logs(carrier=carrier, location=location, since=since, until=until)
+        columns = [col.name for col in NetworkLog.__table__.c]
+        return export_response(format, columns, iter_query_chunks(ReadSessionLocal, stmt), "network_logs")
+    
+    columns = ["id", "timestamp", "carrier", "network_type", "signal_strength", "download_speed",
+               "upload_speed", "latency", "jitter", "packet_loss", "location", "device_info", "app_version"]
+    return export_response(format, columns, iter_memory_chunks(logs_memory, columns), "network_logs")
+
+@app.get("/export/feedback")
+async def export_feedback(format: str = "csv", carrier: Optional[str] = None,
+                          location: Optional[str] = None, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None):
+    if DATABASE_AVAILABLE:
+        stmt = select_feedbacks(carrier=carrier, location=location, since=since, until=until)
+        columns = [col.name for col in Feedback.__table__.c]
+        return export_response(format, columns, iter_query_chunks(ReadSessionLocal, stmt), "feedback")
+    
+    columns = ["id", "timestamp", "overall_satisfaction", "response_time", "usability", "comments",
+               "issue_type", "carrier", "network_type", "location", "signal_strength",
+               "download_speed", "upload_speed", "latency"]
+    return export_response(format, columns, iter_memory_chunks(feedback_memory, columns), "feedback")
+
+@app.post("/export/parquet")
+async def export_parquet():
+    """Append Parquet partitions (by date and carrier) for days not exported yet"""
+    if not DATABASE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Parquet export requires the database")
+    if not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Parquet export requires pyarrow")
+    try:
+        return await run_in_threadpool(run_parquet_export)
+    except Exception as e:
+        print(f"Parquet export error: {e}")
+        raise HTTPException(status_code=500, detail=f"Parquet export failed: {str(e)}")
+
+@app.get("/export/parquet/manifest")
+async def parquet_manifest():
+    return load_manifest()
+
+@app.post("/archive/run")
+async def trigger_archive(after_days: Optional[int] = None):
+    """Move rows older than after_days (default ARCHIVE_AFTER_DAYS) to compressed Parquet files"""
+    if not DATABASE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Archival requires the database")
+    if not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Archival requires pyarrow")
+    after_days = after_days if after_days is not None else ARCHIVE_AFTER_DAYS
+    if after_days <= 0:
+        raise HTTPException(status_code=400, detail="Set after_days (or ARCHIVE_AFTER_DAYS) to a positive number")
+    try:
+        return await run_in_threadpool(run_archive, after_days=after_days)
+    except Exception as e:
+        print(f"Archive error: {e}")
+        raise HTTPException(status_code=500, detail=f"Archival failed: {str(e)}")
+
+@app.post("/archive/rehydrate")
+async def rehydrate_archive(table: str, since: date, until: date):
+    """Copy archived rows of days since <= day < until back into the database"""
+    if not DATABASE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Rehydration requires the database")
+    if not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Rehydration requires pyarrow")
+    try:
+        return await run_in_threadpool(rehydrate, table, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Rehydrate error: {e}")
+        raise HTTPException(status_code=500, detail=f"Rehydration failed: {str(e)}")
+
+@app.get("/archive/manifest")
+async def archive_manifest():
+    return load_archive_manifest()
+
+def store_logs_in_memory(logs: List[Dict[str, Any]]) -> int:
+    """Append validated logs to the in-memory store, mirroring POST /network-logs"""
+    for log in logs:
+        logs_memory.append({
+            "id": len(logs_memory) + 1,
+            "timestamp": datetime.utcnow(),
+            "storage": "memory",
+            **log
+        })
+    return len(logs)
+
+@app.post("/network-logs/stream")
+async def stream_network_logs(request: Request):
+    """Ingest an NDJSON backlog of network logs, one JSON object per line.
+
+    The body is consumed incrementally and inserted in chunks of
+    NDJSON_CHUNK_SIZE records, so large offline backlogs are never held in
+    memory in full. Invalid lines are skipped and reported in the summary.
+    gzip and zstd Content-Encoding are decompressed on the fly. Records
+    carrying a device_id/local_id pair that was already stored are counted
+    as duplicates instead of being inserted again.
+    """
+    if not is_ndjson(request.headers.get("content-type")):
+        raise HTTPException(status_code=415, detail="Expected Content-Type: application/x-ndjson")
+
+    summary = new_ingest_summary()
+    batch = []
+    db = next(get_db()) if DATABASE_AVAILABLE else None
+
+    def flush(logs):
+        nonlocal db
+        if db is not None:
+            try:
+                if sqlite_writer is not None:
+                    prepare_records(NetworkLog, logs)
+                    results = sqlite_writer.submit(create_network_logs_bulk, logs, 1).result()
+                else:
+                    results = create_network_logs_bulk(db, logs, user_id=1)  # Anonymous user
+                duplicates = sum(1 for result in results if result["duplicate"])
+                summary["inserted"] += len(results) - duplicates
+                summary["duplicates"] += duplicates
+                return
+            except Exception as db_error:
+                print(f"Database error during stream ingest, falling back to memory: {db_error}")
+                db.rollback()
+                db.close()
+                db = None
+        summary["stored_in_memory"] += store_logs_in_memory(logs)
+
+    try:
+        async for line_no, line in iter_ndjson_lines(decoded_stream(request, stats=summary)):
+            summary["received"] += 1
+            if isinstance(line, Exception):
+                record_rejection(summary, line_no, line)
+                continue
+            try:
+                batch.append(validate_network_log(line))
+            except Exception as e:
+                record_rejection(summary, line_no, e)
+                continue
+
+            if len(batch) >= NDJSON_CHUNK_SIZE:
+                await run_in_threadpool(flush, batch)
+                summary["chunks"] += 1
+                batch = []
+
+        if batch:
+            await run_in_threadpool(flush, batch)
+            summary["chunks"] += 1
+
+        summary["storage"] = "database" if db is not None else "memory"
+        print(f"✅ Stream ingest finished: {summary['received']} received, {summary['rejected']} rejected")
+        return negotiated_response(request, summary)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Stream ingest error: {e}")
+        raise HTTPException(status_code=500, detail=f"Stream ingest failed: {str(e)}")
+    finally:
+        if db is not None:
+            db.close()
+
+@app.post("/network-logs/batch")
+async def upload_network_log_batch(request: Request):
+    """Ingest a device backlog sent in the compact binary batch format.
+
+    See binary_batch.py for the layout. The batch is decoded into column
+    lists and inserted without per-record dicts; records whose
+    device_id/local_id pair was already stored are counted as duplicates.
+    """
+    if not is_binary_batch(request.headers.get("content-type")):
+        raise HTTPException(status_code=415, detail=f"Expected Content-Type: {BATCH_MEDIA_TYPE}")
+
+    body = await read_body(request)
+    try:
+        batch = await run_in_threadpool(decode_batch, body)
+    except BinaryBatchError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {e}")
+
+    summary = {
+        "received": batch.count,
+        "inserted": 0,
+        "duplicates": 0,
+        "stored_in_memory": 0,
+        "payload_bytes": len(body)
+    }
+    if DATABASE_AVAILABLE:
+        try:
+            # Anonymous user
+            await run_in_threadpool(prepare_columns, NetworkLog, batch.columns, batch.header)
+            result = await run_db_write(create_network_logs_columnar, batch.columns, batch.header, 1)
+            summary.update(result)
+            summary["storage"] = "database"
+            print(f"✅ Batch ingest: {batch.count} received, {result['duplicates']} duplicates")
+            return negotiated_response(request, summary)
+        except Exception as db_error:
+            print(f"Database error during batch ingest, falling back to memory: {db_error}")
+
+    summary["stored_in_memory"] = store_logs_in_memory(list(batch.records()))
+    summary["storage"] = "memory"
+    return negotiated_response(request, summary)
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
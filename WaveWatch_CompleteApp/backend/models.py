@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
+from dimensions import DictionaryEncoded
 
 class User(Base):
     __tablename__ = "users"
@@ -31,11 +32,11 @@ class Feedback(Base):
     
     # Optional feedback details
     comments = Column(Text, nullable=True)
-    issue_type = Column(String, nullable=True)
+    issue_type = Column(DictionaryEncoded("issue_type"), nullable=True)
     
-    # Network context
-    carrier = Column(String, nullable=False)
-    network_type = Column(String, nullable=True)
+    # Network context (dictionary-encoded, see dimensions.py)
+    carrier = Column(DictionaryEncoded("carrier"), nullable=False)
+    network_type = Column(DictionaryEncoded("network_type"), nullable=True)
     
     # Location and timing
     location = Column(String, nullable=False)  # Human-readable location
@@ -47,8 +48,20 @@ class Feedback(Base):
     upload_speed = Column(Float, nullable=True)
     latency = Column(Integer, nullable=True)
     
+    # Idempotency key supplied by the app: device id + row id in its local store
+    device_id = Column(String, nullable=True)
+    local_id = Column(String, nullable=True)
+    
     # Relationship
     user = relationship("User", back_populates="feedbacks")
+    
+    __table_args__ = (
+        Index("uq_feedback_device_local", "device_id", "local_id", unique=True),
+        # Per-provider analytics group by location
+        Index("ix_feedback_carrier_location", "carrier", "location"),
+        # Newest-first lists and exports filtered by carrier and time range
+        Index("ix_feedback_carrier_timestamp", "carrier", "timestamp"),
+    )
 
 class NetworkLog(Base):
     __tablename__ = "network_logs"
@@ -56,9 +69,9 @@ class NetworkLog(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
-    # Network provider/carrier
-    carrier = Column(String, nullable=False, index=True)
-    network_type = Column(String, nullable=True)  # 4G, 5G, WiFi, etc.
+    # Network provider/carrier (dictionary-encoded, see dimensions.py)
+    carrier = Column(DictionaryEncoded("carrier"), nullable=False, index=True)
+    network_type = Column(DictionaryEncoded("network_type"), nullable=True)  # 4G, 5G, WiFi, etc.
     
     # Network performance metrics
     signal_strength = Column(Integer, nullable=True)  # dBm
@@ -73,8 +86,84 @@ class NetworkLog(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     # Additional context
-    device_info = Column(String, nullable=True)
-    app_version = Column(String, nullable=True)
+    device_info = Column(DictionaryEncoded("device_info"), nullable=True)
+    app_version = Column(DictionaryEncoded("app_version"), nullable=True)
+    
+    # Idempotency key supplied by the app: device id + row id in its local store
+    device_id = Column(String, nullable=True)
+    local_id = Column(String, nullable=True)
     
     # Relationship
     user = relationship("User", back_populates="network_logs")
+    
+    __table_args__ = (
+        Index("uq_network_logs_device_local", "device_id", "local_id", unique=True),
+        # Per-provider analytics group by location
+        Index("ix_network_logs_carrier_location", "carrier", "location"),
+        # Newest-first lists and exports filtered by carrier and time range
+        Index("ix_network_logs_carrier_timestamp", "carrier", "timestamp"),
+        # Rows arrive roughly in time order, so a BRIN index serves range scans
+        # (retention, archival, partition checks) at a fraction of a B-tree's size
+        Index("ix_network_logs_timestamp_brin", "timestamp", postgresql_using="brin").ddl_if(dialect="postgresql"),
+    )
+
+class NetworkLogRollup(Base):
+    """Pre-aggregated network_logs per time bucket (see rollups.py)"""
+    __tablename__ = "network_log_rollups"
+    
+    id = Column(Integer, primary_key=True)
+    level = Column(String, nullable=False)  # minute, hour or day
+    bucket = Column(DateTime(timezone=True), nullable=False)  # Bucket start (UTC)
+    
+    # Rollup dimensions; empty string instead of NULL so the unique key matches
+    location = Column(String, nullable=False)
+    carrier = Column(String, nullable=False)
+    network_type = Column(String, nullable=False, default="")
+    
+    # Sums and non-null counts, so buckets can be merged and averaged exactly
+    samples = Column(Integer, nullable=False, default=0)
+    download_speed_sum = Column(Float, nullable=False, default=0)
+    download_speed_count = Column(Integer, nullable=False, default=0)
+    upload_speed_sum = Column(Float, nullable=False, default=0)
+    upload_speed_count = Column(Integer, nullable=False, default=0)
+    latency_sum = Column(Float, nullable=False, default=0)
+    latency_count = Column(Integer, nullable=False, default=0)
+    jitter_sum = Column(Float, nullable=False, default=0)
+    jitter_count = Column(Integer, nullable=False, default=0)
+    packet_loss_sum = Column(Float, nullable=False, default=0)
+    packet_loss_count = Column(Integer, nullable=False, default=0)
+    signal_strength_sum = Column(Float, nullable=False, default=0)
+    signal_strength_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("uq_rollups_bucket_key", "level", "bucket", "location", "carrier", "network_type", unique=True),
+    )
+
+class RollupWatermark(Base):
+    """Progress of the rollup job over network_logs ids"""
+    __tablename__ = "rollup_watermarks"
+    
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)     # Rolled up through this id
+    pending_id = Column(Integer, nullable=False, default=0)  # Max id seen by the previous run
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+
+class DimensionValue(Base):
+    """Distinct strings of dictionary-encoded columns (see dimensions.py)"""
+    __tablename__ = "dimension_values"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # carrier, network_type, device_info, ...
+    value = Column(String, nullable=False)
+    
+    __table_args__ = (
+        Index("uq_dimension_values_kind_value", "kind", "value", unique=True),
+    )
+
+class SchemaState(Base):
+    """Fingerprint of the last fully reconciled schema (see DatabaseManager)"""
+    __tablename__ = "schema_state"
+    
+    name = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    applied_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,225 @@
+"""
+Incremental, partitioned Parquet export of network_logs and feedback for offline analysis.
+
+Files are laid out Hive-style so pandas/pyarrow/DuckDB can read them with
+partition pruning:
+
+    {PARQUET_EXPORT_DIR}/{table}/date=YYYY-MM-DD/carrier={carrier}/part-{run}.parquet
+
+As usual for Hive partitioning, the partition columns live only in the
+(URI-encoded) directory names, not inside the files.
+
+Only complete (UTC) days are exported. Every run appends new part files for
+rows that were not covered by a previous run: rows of days that were still
+open at the last run, plus late arrivals (offline devices uploading old
+measurements) detected by their id being above the last exported id.
+Progress is tracked in {PARQUET_EXPORT_DIR}/manifest.json.
+
+Run manually with:  python parquet_export.py
+"""
+import json
+import os
+from urllib.parse import quote
+from datetime import datetime, time, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, and_, func, or_, select
+
+from database import SessionLocal
+from models import Feedback, NetworkLog
+
+# pyarrow is optional; the export is disabled without it
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    print("⚠️ pyarrow library not available, Parquet export disabled")
+
+PARQUET_EXPORT_DIR = os.getenv("PARQUET_EXPORT_DIR", "./exports/parquet")
+PARQUET_CHUNK_ROWS = int(os.getenv("PARQUET_CHUNK_ROWS", "20000"))
+
+EXPORT_TABLES = {
+    "network_logs": NetworkLog,
+    "feedback": Feedback,
+}
+
+# Low-cardinality strings stored as dictionary-encoded columns
+DICTIONARY_COLUMNS = {
+    "carrier", "network_type", "location", "device_info", "app_version", "issue_type", "device_id"
+}
+
+
+def _arrow_type(column):
+    if column.name in DICTIONARY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+def arrow_schema(model, exclude=("carrier",)) -> "pa.Schema":
+    """Arrow schema of a model table; carrier is a partition directory by default"""
+    return pa.schema([
+        pa.field(col.name, _arrow_type(col)) for col in model.__table__.c if col.name not in exclude
+    ])
+
+
+def _partition_value(value: Optional[str]) -> str:
+    # pyarrow's hive partitioning decodes URI-encoded segments by default
+    return quote(value or "unknown", safe="")
+
+
+def load_manifest(export_dir: str = PARQUET_EXPORT_DIR) -> Dict[str, Any]:
+    path = os.path.join(export_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"tables": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest: Dict[str, Any], export_dir: str):
+    path = os.path.join(export_dir, "manifest.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+class _PartitionWriters:
+    """Lazily opened ParquetWriter per (date, carrier) partition"""
+
+    def __init__(self, table_dir: str, run_id: str, schema):
+        self.table_dir = table_dir
+        self.run_id = run_id
+        self.schema = schema
+        self.writers = {}
+        self.rows = {}
+
+    def path_for(self, day: str, carrier: str) -> str:
+        return os.path.join(
+            self.table_dir, f"date={day}", f"carrier={_partition_value(carrier)}",
+            f"part-{self.run_id}.parquet"
+        )
+
+    def write(self, day: str, carrier: str, columns: Dict[str, List[Any]]):
+        key = (day, carrier)
+        if key not in self.writers:
+            path = self.path_for(day, carrier)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.writers[key] = pq.ParquetWriter(
+                path, self.schema, compression="zstd", use_dictionary=True
+            )
+            self.rows[key] = 0
+        batch = pa.RecordBatch.from_pydict(columns, schema=self.schema)
+        self.writers[key].write_batch(batch)
+        self.rows[key] += batch.num_rows
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def discard(self):
+        self.close()
+        for day, carrier in self.writers:
+            path = self.path_for(day, carrier)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def export_table(db, table_name: str, manifest: Dict[str, Any], export_dir: str,
+                 run_id: str, cutoff: datetime) -> Dict[str, Any]:
+    """Export rows of one table not covered by previous runs; returns a run summary"""
+    model = EXPORT_TABLES[table_name]
+    state = manifest["tables"].setdefault(
+        table_name, {"last_max_id": 0, "last_cutoff": None, "partitions": {}}
+    )
+    table = model.__table__.c
+    column_names = [col.name for col in model.__table__.c]
+    file_columns = [name for name in column_names if name != "carrier"]
+
+    snapshot_max_id = db.execute(select(func.max(table.id))).scalar() or 0
+    pending = table.id > state["last_max_id"]
+    if state["last_cutoff"]:
+        pending = or_(pending, table.timestamp >= datetime.fromisoformat(state["last_cutoff"]))
+    stmt = (
+        select(*model.__table__.c)
+        .where(and_(table.timestamp < cutoff, table.id <= snapshot_max_id, pending))
+        .order_by(table.timestamp, table.id)
+        .execution_options(yield_per=PARQUET_CHUNK_ROWS)
+    )
+
+    writers = _PartitionWriters(os.path.join(export_dir, table_name), run_id, arrow_schema(model))
+    try:
+        for chunk in db.execute(stmt).partitions():
+            grouped: Dict[tuple, Dict[str, List[Any]]] = {}
+            for row in chunk:
+                ts = row.timestamp
+                if ts.tzinfo is None:
+                    ts = ts.replace(tzinfo=timezone.utc)
+                key = (ts.astimezone(timezone.utc).date().isoformat(), row.carrier)
+                columns = grouped.get(key)
+                if columns is None:
+                    columns = grouped[key] = {name: [] for name in file_columns}
+                for name, value in zip(column_names, row):
+                    if name != "carrier":
+                        columns[name].append(value)
+            for (day, carrier), columns in grouped.items():
+                writers.write(day, carrier, columns)
+        writers.close()
+    except Exception:
+        writers.discard()
+        raise
+
+    written = []
+    for (day, carrier), rows in sorted(writers.rows.items()):
+        path = writers.path_for(day, carrier)
+        entry = state["partitions"].setdefault(f"{day}/{carrier}", {"rows": 0, "files": []})
+        entry["rows"] += rows
+        entry["files"].append(os.path.relpath(path, export_dir))
+        written.append({"date": day, "carrier": carrier, "rows": rows, "bytes": os.path.getsize(path)})
+
+    state["last_max_id"] = max(state["last_max_id"], snapshot_max_id)
+    state["last_cutoff"] = cutoff.isoformat()
+    return {
+        "table": table_name,
+        "rows": sum(item["rows"] for item in written),
+        "files": written
+    }
+
+
+def run_parquet_export(export_dir: str = PARQUET_EXPORT_DIR, tables: Optional[List[str]] = None,
+                       session_factory=SessionLocal) -> Dict[str, Any]:
+    """Append Parquet partitions for all complete days not exported yet"""
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed")
+
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = load_manifest(export_dir)
+    now = datetime.now(timezone.utc)
+    cutoff = datetime.combine(now.date(), time.min, tzinfo=timezone.utc)
+    run_id = now.strftime("%Y%m%dT%H%M%S")
+
+    summary = {"run_id": run_id, "cutoff": cutoff.isoformat(), "tables": []}
+    db = session_factory()
+    try:
+        for table_name in tables or list(EXPORT_TABLES):
+            summary["tables"].append(export_table(db, table_name, manifest, export_dir, run_id, cutoff))
+            # Persist progress per table so a later failure does not re-export finished tables
+            _save_manifest(manifest, export_dir)
+    finally:
+        db.close()
+    return summary
+
+
+if __name__ == "__main__":
+    result = run_parquet_export()
+    for table_summary in result["tables"]:
+        print(f"📦 {table_summary['table']}: {table_summary['rows']} rows in {len(table_summary['files'])} files")
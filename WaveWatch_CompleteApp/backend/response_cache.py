@@ -0,0 +1,206 @@
+"""
+In-process cache for expensive aggregate responses (recommendations, analytics).
+
+Entries hold the serialized body as a PrecompressedBody, so a cache hit
+returns stored bytes (and stored gzip/brotli variants) without running the
+query, the serializer or the compressor again. Loads are single-flight:
+concurrent requests for the same missing or expired entry share one query,
+and recently expired entries keep being served while one refresh runs in the
+background (stale-while-revalidate).
+
+Aggregate version counters drive conditional GETs: every successful ingest
+bumps the counters of the affected location and carrier, and aggregate
+responses carry an ETag / Last-Modified built from them. A client revalidating
+an unchanged result gets 304 Not Modified without any database work.
+Counters live in the process and the ETag embeds a per-process boot id, so a
+restart (or another worker) never produces a false 304; it only costs one
+full response.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+RECOMMENDATIONS_CACHE_TTL = float(os.getenv("RECOMMENDATIONS_CACHE_TTL", "60"))
+# How long an expired entry may still be served while it is being refreshed
+RECOMMENDATIONS_STALE_TTL = float(os.getenv("RECOMMENDATIONS_STALE_TTL", "300"))
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+ANALYTICS_STALE_TTL = float(os.getenv("ANALYTICS_STALE_TTL", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+
+class SingleFlight:
+    """Coalesces concurrent computations of the same key into one.
+
+    The first caller starts the computation as a task; callers arriving while
+    it runs await the same task. The task is shielded, so a caller that goes
+    away (client disconnect) does not cancel the work for the others.
+    """
+
+    def __init__(self, stats: Optional[Dict[str, int]] = None):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = stats if stats is not None else {}
+        self.stats.update(started=0, coalesced=0)
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["started"] += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+
+class SWRCache:
+    """LRU cache with single-flight loading and stale-while-revalidate.
+
+    Within ttl an entry is served as is. For stale_ttl seconds after that it
+    is still served, while one background refresh replaces it. Misses (and
+    entries past the stale window) are loaded once no matter how many
+    requests ask concurrently. Used from the event loop only.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (fresh_until, stale_until, value)
+        self._refreshes = set()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refresh_errors": 0}
+        self._flights = SingleFlight(self.stats)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            fresh_until, stale_until, value = entry
+            now = time.monotonic()
+            if now < fresh_until:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            if now < stale_until:
+                self.stats["stale_hits"] += 1
+                self._refresh_in_background(key, loader)
+                return value
+        self.stats["misses"] += 1
+        return await self._flights.do(key, lambda: self._load(key, loader))
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await loader()
+        now = time.monotonic()
+        self._entries[key] = (now + self.ttl, now + self.ttl + self.stale_ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def _refresh_in_background(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        if self._flights.in_flight(key):
+            return
+        task = asyncio.ensure_future(self._flights.do(key, lambda: self._load(key, loader)))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task):
+        self._refreshes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # Keep serving the stale entry; the next stale hit retries
+            self.stats["refresh_errors"] += 1
+            print(f"⚠️ Background cache refresh failed: {task.exception()}")
+
+    def clear(self):
+        self._entries.clear()
+
+
+class AggregateVersions:
+    """Per-location and per-carrier change counters, bumped on ingest"""
+
+    def __init__(self):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.started_at = time.time()
+        self._locations: Dict[str, Tuple[int, float]] = {}
+        self._carriers: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bump(counters: Dict[str, Tuple[int, float]], key: Optional[str], now: float):
+        if key:
+            key = key.lower()
+            counters[key] = (counters.get(key, (0, 0.0))[0] + 1, now)
+
+    def bump(self, pairs: Iterable[Tuple[Optional[str], Optional[str]]]):
+        """Record changes for (location, carrier) pairs of newly stored rows"""
+        now = time.time()
+        with self._lock:
+            for location, carrier in set(pairs):
+                self._bump(self._locations, location, now)
+                self._bump(self._carriers, carrier, now)
+
+    def _combine(self, matches) -> Tuple[int, float]:
+        version, modified = 0, self.started_at
+        for count, changed_at in matches:
+            version += count
+            modified = max(modified, changed_at)
+        return version, modified
+
+    def for_location(self, query: str) -> Tuple[int, float]:
+        """(version, last modified) for a location filter.
+
+        Mirrors the ILIKE %query% filter of the queries: every known location
+        containing the query contributes its counter.
+        """
+        query = query.lower()
+        with self._lock:
+            return self._combine(v for loc, v in self._locations.items() if query in loc)
+
+    def for_carrier(self, carrier: str) -> Tuple[int, float]:
+        with self._lock:
+            return self._combine([self._carriers[carrier.lower()]] if carrier.lower() in self._carriers else [])
+
+    def etag(self, scope: str, version: int) -> str:
+        # Weak: the same result is served in several content encodings
+        digest = hashlib.blake2b(scope.encode("utf-8"), digest_size=6).hexdigest()
+        return f'W/"{digest}-{self.boot_id}-{version}"'
+
+
+def validator_headers(etag: str, last_modified: float) -> Dict[str, str]:
+    return {"ETag": etag, "Last-Modified": formatdate(last_modified, usegmt=True)}
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = {tag.strip() for tag in if_none_match.split(",")}
+        # Weak comparison: W/"x" matches "x"
+        return "*" in candidates or etag in candidates or etag[2:] in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+recommendations_cache = SWRCache(ttl=RECOMMENDATIONS_CACHE_TTL, stale_ttl=RECOMMENDATIONS_STALE_TTL)
+analytics_cache = SWRCache(ttl=ANALYTICS_CACHE_TTL, stale_ttl=ANALYTICS_STALE_TTL)
+aggregate_versions = AggregateVersions()
@@ -0,0 +1,296 @@
+"""
+Minute / hour / day rollups of network_logs with retention.
+
+A background job folds new network_logs rows into network_log_rollups, one
+row per (level, bucket, location, carrier, network_type) holding sums and
+non-null counts of every metric. Rows are picked up by id rather than by
+timestamp, so late uploads from offline devices are added to their (old)
+buckets as well. The job lags one run behind the newest id so that inserts
+still in flight when an id was allocated have committed before it is read.
+
+Retention is configured per level in days (0 = keep forever); raw rows are
+only deleted once they have been rolled up. On a partitioned network_logs
+(see DatabaseManager) whole expired months are dropped as partitions.
+
+query_rollups() routes a time range to the coarsest level that still has
+data for the whole range and yields at least ROLLUP_MIN_BUCKETS buckets, so
+a dashboard over months reads day buckets instead of millions of raw rows.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import SessionLocal
+from models import NetworkLog, NetworkLogRollup, RollupWatermark
+
+BUCKET_SIZES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+LEVELS_COARSEST_FIRST = ("day", "hour", "minute")
+METRICS = ("download_speed", "upload_speed", "latency", "jitter", "packet_loss", "signal_strength")
+
+
+def _retention_days(name: str, default: str) -> Optional[timedelta]:
+    days = float(os.getenv(name, default))
+    return timedelta(days=days) if days > 0 else None
+
+
+RETENTION = {
+    "raw": _retention_days("RAW_LOG_RETENTION_DAYS", "0"),
+    "minute": _retention_days("MINUTE_ROLLUP_RETENTION_DAYS", "7"),
+    "hour": _retention_days("HOUR_ROLLUP_RETENTION_DAYS", "90"),
+    "day": _retention_days("DAY_ROLLUP_RETENTION_DAYS", "0"),
+}
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_INTERVAL_SECONDS = int(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+ROLLUP_BATCH_ROWS = int(os.getenv("ROLLUP_BATCH_ROWS", "20000"))
+RETENTION_DELETE_BATCH = int(os.getenv("RETENTION_DELETE_BATCH", "10000"))
+ROLLUP_MIN_BUCKETS = int(os.getenv("ROLLUP_MIN_BUCKETS", "24"))
+
+WATERMARK_NAME = "network_logs"
+
+rollup_metrics = {"runs": 0, "rows_rolled_up": 0, "buckets_upserted": 0, "last_run": None,
+                  "retention_deleted": {}}
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def bucket_start(value: datetime, level: str) -> datetime:
+    value = _utc(value).replace(second=0, microsecond=0)
+    if level in ("hour", "day"):
+        value = value.replace(minute=0)
+    if level == "day":
+        value = value.replace(hour=0)
+    return value
+
+
+def _upsert_buckets(db, buckets: Dict[tuple, list]):
+    """Add accumulated sums/counts to existing bucket rows (or create them)"""
+    table = NetworkLogRollup.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        insert = postgresql.insert
+    elif dialect == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise RuntimeError(f"Rollups need ON CONFLICT support, not available on {dialect}")
+
+    value_columns = ["samples"] + [f"{metric}_{part}" for metric in METRICS for part in ("sum", "count")]
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["level", "bucket", "location", "carrier", "network_type"],
+        set_={name: table.c[name] + stmt.excluded[name] for name in value_columns}
+    )
+    params = [
+        {"level": level, "bucket": bucket, "location": location, "carrier": carrier,
+         "network_type": network_type, **dict(zip(value_columns, values))}
+        for (level, bucket, location, carrier, network_type), values in buckets.items()
+    ]
+    for i in range(0, len(params), 1000):
+        db.execute(stmt, params[i:i + 1000])
+
+
+def run_rollups(session_factory=SessionLocal) -> Dict[str, Any]:
+    """Fold network_logs rows added since the last run into all rollup levels"""
+    logs = NetworkLog.__table__.c
+    db = session_factory()
+    try:
+        # Row lock serializes concurrent runs (several workers) on PostgreSQL
+        mark = db.execute(
+            select(RollupWatermark).where(RollupWatermark.name == WATERMARK_NAME).with_for_update()
+        ).scalar_one_or_none()
+        if mark is None:
+            mark = RollupWatermark(name=WATERMARK_NAME, last_id=0, pending_id=0)
+            db.add(mark)
+            db.flush()
+
+        newest_id = db.execute(select(func.max(logs.id))).scalar() or 0
+        # Only ids already seen by the previous run: their inserts have committed
+        upper = mark.pending_id
+        rows = 0
+        buckets: Dict[tuple, list] = {}
+        if upper > mark.last_id:
+            stmt = (
+                select(logs.timestamp, logs.location, logs.carrier, logs.network_type,
+                       *(logs[metric] for metric in METRICS))
+                .where(logs.id > mark.last_id, logs.id <= upper)
+                .execution_options(yield_per=ROLLUP_BATCH_ROWS)
+            )
+            for partition in db.execute(stmt).partitions():
+                for row in partition:
+                    if row.timestamp is None:
+                        continue
+                    rows += 1
+                    metrics = row[4:]
+                    for level in BUCKET_SIZES:
+                        key = (level, bucket_start(row.timestamp, level), row.location, row.carrier,
+                               row.network_type or "")
+                        values = buckets.get(key)
+                        if values is None:
+                            values = buckets[key] = [0] * (1 + 2 * len(METRICS))
+                        values[0] += 1
+                        for i, value in enumerate(metrics):
+                            if value is not None:
+                                values[1 + 2 * i] += value
+                                values[2 + 2 * i] += 1
+            _upsert_buckets(db, buckets)
+            mark.last_id = upper
+
+        mark.pending_id = max(newest_id, upper)
+        mark.updated_at = datetime.now(timezone.utc)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    rollup_metrics["runs"] += 1
+    rollup_metrics["rows_rolled_up"] += rows
+    rollup_metrics["buckets_upserted"] += len(buckets)
+    rollup_metrics["last_run"] = datetime.now(timezone.utc).isoformat()
+    return {"rows": rows, "buckets": len(buckets), "rolled_up_through_id": upper}
+
+
+def apply_retention(session_factory=SessionLocal, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Delete raw rows and rollup buckets older than their retention, in batches"""
+    from database_manager import db_manager
+    now = now or datetime.now(timezone.utc)
+    logs = NetworkLog.__table__.c
+    rollups = NetworkLogRollup.__table__.c
+    deleted = {}
+    db = session_factory()
+    try:
+        if RETENTION["raw"]:
+            rolled_up_id = db.execute(
+                select(RollupWatermark.last_id).where(RollupWatermark.name == WATERMARK_NAME)
+            ).scalar() or 0
+            if db_manager.is_partitioned(NetworkLog.__tablename__):
+                # Whole months go as a metadata operation; the DELETE below only
+                # sees the partially expired month and the default partition
+                dropped = db_manager.drop_expired_partitions(
+                    NetworkLog.__tablename__, RETENTION["raw"], safe_through_id=rolled_up_id
+                )
+                deleted["raw_partitions"] = len(dropped)
+            expired = select(logs.id).where(
+                logs.timestamp < now - RETENTION["raw"], logs.id <= rolled_up_id
+            ).limit(RETENTION_DELETE_BATCH)
+            deleted["raw"] = _delete_in_batches(db, NetworkLog.__table__, logs.id, expired)
+
+        for level in BUCKET_SIZES:
+            if RETENTION[level]:
+                expired = select(rollups.id).where(
+                    rollups.level == level, rollups.bucket < now - RETENTION[level]
+                ).limit(RETENTION_DELETE_BATCH)
+                deleted[level] = _delete_in_batches(db, NetworkLogRollup.__table__, rollups.id, expired)
+    finally:
+        db.close()
+
+    for name, count in deleted.items():
+        rollup_metrics["retention_deleted"][name] = rollup_metrics["retention_deleted"].get(name, 0) + count
+    return deleted
+
+
+def _delete_in_batches(db, table, id_column, expired_ids) -> int:
+    total = 0
+    while True:
+        ids = db.execute(expired_ids).scalars().all()
+        if not ids:
+            return total
+        db.execute(delete(table).where(id_column.in_(ids)))
+        db.commit()
+        total += len(ids)
+
+
+def choose_level(since: datetime, until: datetime, now: Optional[datetime] = None) -> str:
+    """Coarsest level with retention covering `since` and enough buckets for the range"""
+    now = now or datetime.now(timezone.utc)
+    span = _utc(until) - _utc(since)
+    for level in LEVELS_COARSEST_FIRST:
+        retention = RETENTION[level]
+        if retention and _utc(since) < now - retention:
+            continue
+        if span >= BUCKET_SIZES[level] * ROLLUP_MIN_BUCKETS:
+            return level
+    return "minute"
+
+
+def query_rollups(db, since: datetime, until: Optional[datetime] = None, location: Optional[str] = None,
+                  carrier: Optional[str] = None, level: Optional[str] = None) -> Dict[str, Any]:
+    """Bucketed averages for a time range, read from the routed rollup level.
+
+    The range is widened to whole buckets of the chosen level.
+    """
+    until = until or datetime.now(timezone.utc)
+    level = level or choose_level(since, until)
+    if level not in BUCKET_SIZES:
+        raise ValueError(f"Unknown rollup level: {level}")
+
+    rollups = NetworkLogRollup.__table__.c
+    stmt = (
+        select(NetworkLogRollup.__table__)
+        .where(rollups.level == level,
+               rollups.bucket >= bucket_start(since, level),
+               rollups.bucket < _utc(until))
+        .order_by(rollups.bucket, rollups.location, rollups.carrier, rollups.network_type)
+    )
+    if location:
+        stmt = stmt.where(rollups.location.ilike(f"%{location}%"))
+    if carrier:
+        stmt = stmt.where(rollups.carrier == carrier)
+
+    buckets = []
+    for row in db.execute(stmt).mappings():
+        bucket = {
+            "bucket": row["bucket"],
+            "location": row["location"],
+            "carrier": row["carrier"],
+            "network_type": row["network_type"] or None,
+            "samples": row["samples"],
+        }
+        for metric in METRICS:
+            count = row[f"{metric}_count"]
+            bucket[f"avg_{metric}"] = round(row[f"{metric}_sum"] / count, 2) if count else None
+        buckets.append(bucket)
+    return {"level": level, "since": since, "until": until, "buckets": buckets}
+
+
+async def rollup_worker():
+    """Background loop started by the API: rollups every minute, partitions and retention hourly"""
+    from database_manager import db_manager
+    last_retention = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
+        try:
+            summary = await run_in_threadpool(run_rollups)
+            if summary["rows"]:
+                print(f"📊 Rolled up {summary['rows']} network logs into {summary['buckets']} buckets")
+            if loop.time() - last_retention >= RETENTION_INTERVAL_SECONDS:
+                last_retention = loop.time()
+                await run_in_threadpool(db_manager.maintain_partitions)
+                deleted = await run_in_threadpool(apply_retention)
+                if any(deleted.values()):
+                    print(f"🧹 Retention removed {deleted}")
+        except Exception as e:
+            print(f"⚠️ Rollup job failed: {e}")
+
+
+if __name__ == "__main__":
+    # Catch up manually; the second pass picks up ids the first one only noted
+    for _ in range(2):
+        print(f"📊 {run_rollups()}")
+    print(f"🧹 {apply_retention()}")
@@ -41,6 +41,9 @@ class FeedbackBase(BaseModel):
     download_speed: Optional[float] = None
     upload_speed: Optional[float] = None
     latency: Optional[int] = None
+    # Optional idempotency key: retried uploads with the same pair are stored once
+    device_id: Optional[str] = None
+    local_id: Optional[str] = None
 
 class FeedbackCreate(FeedbackBase):
     pass
@@ -66,9 +69,13 @@ class NetworkLogBase(BaseModel):
     location: str
     device_info: Optional[str] = None
     app_version: Optional[str] = None
+    # Optional idempotency key: retried uploads with the same pair are stored once
+    device_id: Optional[str] = None
+    local_id: Optional[str] = None
 
 class NetworkLogCreate(NetworkLogBase):
-    pass
+    # When the measurement was taken on the device; defaults to upload time
+    timestamp: Optional[datetime] = None
 
 class NetworkLogResponse(NetworkLogBase):
     id: int
@@ -0,0 +1,162 @@
+"""
+Fast JSON encoding/decoding for request bodies and API responses.
+
+orjson is used when installed (it serializes datetimes natively and is several
+times faster than the stdlib); everything falls back to the json module
+otherwise. List endpoints serialize straight from rows through Pydantic v2
+TypeAdapters, skipping FastAPI's jsonable_encoder pass.
+
+Clients that send `Accept: application/msgpack` get MessagePack instead of
+JSON, and request bodies sent as `Content-Type: application/msgpack` are
+decoded the same way (requires the msgpack package). Datetimes are encoded
+as ISO strings in both formats so the payload shape is identical.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter
+
+from schemas import FeedbackResponse, NetworkLogResponse, RecommendationResponse
+
+# orjson is optional
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    print("⚠️ orjson library not available, using standard json")
+
+# msgpack is optional; without it every client gets JSON
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+    print("⚠️ msgpack library not available, MessagePack negotiation disabled")
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+JSON_MEDIA_TYPES = {"application/json", "application/*", "*/*"}
+
+# Default response class for the app
+DefaultResponse = ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def json_loads(data: bytes) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8") if isinstance(data, (bytes, bytearray)) else data)
+
+
+def json_dumps(value: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value, default=_json_default)
+    return json.dumps(value, default=_json_default).encode("utf-8")
+
+
+def _accept_quality(accept: str, media_types: set) -> float:
+    """Highest q value the Accept header gives to any of media_types"""
+    best = 0.0
+    for entry in accept.split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        if parts[0].lower() not in media_types:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        best = max(best, quality)
+    return best
+
+
+def is_msgpack(content_type: str) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES
+
+
+def wants_msgpack(request: Request) -> bool:
+    """True when the client prefers MessagePack over JSON in its Accept header"""
+    if not MSGPACK_AVAILABLE:
+        return False
+    accept = request.headers.get("accept", "")
+    msgpack_quality = _accept_quality(accept, MSGPACK_MEDIA_TYPES)
+    return msgpack_quality > 0 and msgpack_quality >= _accept_quality(accept, JSON_MEDIA_TYPES)
+
+
+def decode_body(body: bytes, content_type: str) -> Any:
+    """Decode a request body according to its Content-Type (msgpack or JSON)"""
+    if is_msgpack(content_type):
+        if not MSGPACK_AVAILABLE:
+            raise HTTPException(status_code=415, detail="MessagePack bodies are not supported by this server")
+        # timestamp=3 turns msgpack Timestamp extensions into datetimes
+        return msgpack.unpackb(body, raw=False, timestamp=3)
+    return json_loads(body)
+
+
+def msgpack_response(value: Any, status_code: int = 200) -> Response:
+    return Response(
+        content=msgpack.packb(value, default=_json_default, datetime=False),
+        status_code=status_code,
+        media_type=MSGPACK_MEDIA_TYPE,
+        headers={"Vary": "Accept"}
+    )
+
+
+def negotiated_response(request: Request, value: Any, status_code: int = 200) -> Response:
+    """Encode an arbitrary payload as MessagePack or JSON depending on Accept"""
+    if wants_msgpack(request):
+        return msgpack_response(value, status_code)
+    return DefaultResponse(content=jsonable_encoder(value), status_code=status_code, headers={"Vary": "Accept"})
+
+
+def admin_feedback(record) -> dict:
+    """Feedback row in the shape of the admin app's Feedback model.
+
+    The admin model needs non-null numbers; values the mobile app does not
+    collect with feedback (jitter, packet loss, coordinates) are reported as 0.
+    """
+    return {
+        "id": str(record["id"]),
+        "timestamp": record["timestamp"],
+        "location": record.get("location") or "",
+        "jitter": 0.0,
+        "latency": float(record.get("latency") or 0),
+        "packet_loss": 0.0,
+        "signal_strength": float(record.get("signal_strength") or 0),
+        "user_rating": record.get("overall_satisfaction") or 0,
+        "comments": record.get("comments") or "",
+        "description": record.get("issue_type") or "",
+        "latitude": 0.0,
+        "longitude": 0.0,
+    }
+
+
+# Schema-driven serializers for list responses
+network_log_list = TypeAdapter(List[NetworkLogResponse])
+feedback_list = TypeAdapter(List[FeedbackResponse])
+recommendation_list = TypeAdapter(List[RecommendationResponse])
+
+
+def rows_response(adapter: TypeAdapter, rows: List[dict], request: Optional[Request] = None) -> Response:
+    """Validate rows against the response schema and emit JSON (or msgpack) bytes in one pass"""
+    validated = adapter.validate_python(rows)
+    if request is not None and wants_msgpack(request):
+        return msgpack_response(adapter.dump_python(validated, mode="json"))
+    return Response(
+        content=adapter.dump_json(validated),
+        media_type="application/json",
+        headers={"Vary": "Accept"}
+    )